@@ -0,0 +1,134 @@
+# Organisation de l'archive des factures, répartie par année et par mois :
+#
+#   factures/2026/10/facture_20261018_101500.pdf
+#
+# L'index enregistre le chemin relatif ("2026/10/facture_....pdf") : ouvrir une
+# facture ne demande aucun parcours de dossier, et aucun dossier ne dépasse le
+# volume d'un mois.
+#
+#   python archive.py migrate [dossier_factures]   range un ancien dossier à plat
+import os
+import sys
+from datetime import datetime
+
+FACTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'factures')
+
+
+def shard(date):
+    return f"{date.year:04d}/{date.month:02d}"
+
+
+def relative_path(fichier, date):
+    # Chemin stocké dans l'index, toujours avec des "/"
+    return f"{shard(date)}/{fichier}"
+
+
+def resolve(relpath, factures_dir=None):
+    return os.path.join(factures_dir or FACTURES_DIR, *relpath.split('/'))
+
+
+def invoice_path(fichier, date, factures_dir=None):
+    """Chemin complet de la facture `fichier` datée `date` ; crée son dossier."""
+    path = resolve(relative_path(fichier, date), factures_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _is_shard_name(name, width):
+    return len(name) == width and name.isdigit()
+
+
+def iter_shards(factures_dir=None):
+    """Dossiers de l'archive : (chemin relatif, chemin complet), la racine
+    ("") puis chaque dossier année/mois."""
+    factures_dir = factures_dir or FACTURES_DIR
+    if not os.path.isdir(factures_dir):
+        return
+    yield "", factures_dir
+    with os.scandir(factures_dir) as racine:
+        annees = sorted(e.name for e in racine if e.is_dir() and _is_shard_name(e.name, 4))
+    for annee in annees:
+        with os.scandir(os.path.join(factures_dir, annee)) as mois_entries:
+            mois = sorted(e.name for e in mois_entries if e.is_dir() and _is_shard_name(e.name, 2))
+        for m in mois:
+            yield f"{annee}/{m}", os.path.join(factures_dir, annee, m)
+
+
+def list_pdfs(reldir, path):
+    # (chemin relatif, os.DirEntry) des PDF d'un seul dossier de l'archive
+    prefix = f"{reldir}/" if reldir else ""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.pdf') and entry.is_file():
+                yield prefix + entry.name, entry
+
+
+def iter_pdfs(factures_dir=None):
+    """Parcourt l'archive : (chemin relatif, os.DirEntry) de chaque PDF, à la
+    racine (ancien format à plat) et dans les dossiers année/mois."""
+    for reldir, path in iter_shards(factures_dir):
+        yield from list_pdfs(reldir, path)
+
+
+def _move_in_index(conn, relpath, cible):
+    with conn:
+        for table in ("factures", "contenus", "termes", "ventilation"):
+            conn.execute(f"UPDATE {table} SET fichier = ? WHERE fichier = ?", (cible, relpath))
+
+
+def migrate(factures_dir=None):
+    """Déplace les PDF de la racine dans leur dossier année/mois et met l'index
+    à jour. La date vient de l'index si elle est connue, sinon du fichier."""
+    import index
+
+    factures_dir = factures_dir or FACTURES_DIR
+    conn = index.connect(factures_dir)
+    dates = dict(conn.execute("SELECT fichier, date FROM factures WHERE fichier NOT LIKE '%/%'"))
+    # Migration précédente interrompue entre le déplacement et l'index : le
+    # fichier est déjà rangé, seule l'entrée de l'index est à corriger
+    for relpath, date in dates.items():
+        if date and not os.path.exists(resolve(relpath, factures_dir)):
+            cible = relative_path(relpath, datetime.fromisoformat(date))
+            if os.path.exists(resolve(cible, factures_dir)):
+                _move_in_index(conn, relpath, cible)
+    deplaces = 0
+    for relpath, entry in list(iter_pdfs(factures_dir)):
+        if '/' in relpath:
+            continue
+        if dates.get(relpath):
+            date = datetime.fromisoformat(dates[relpath])
+        else:
+            date = datetime.fromtimestamp(entry.stat().st_ctime)
+        cible = relative_path(relpath, date)
+        chemin_cible = invoice_path(relpath, date, factures_dir)
+        if os.path.exists(chemin_cible):
+            print(f"  ignoré (existe déjà) : {cible}", file=sys.stderr)
+            continue
+        # Un fichier à la fois, l'index n'est mis à jour qu'une fois le fichier
+        # déplacé ; si la mise à jour échoue, le fichier reprend sa place
+        os.replace(entry.path, chemin_cible)
+        if relpath in dates:
+            try:
+                _move_in_index(conn, relpath, cible)
+            except BaseException:
+                os.replace(chemin_cible, entry.path)
+                raise
+        deplaces += 1
+    conn.close()
+    # Les factures absentes de l'index y sont ajoutées avec leur nouveau chemin
+    index.rebuild(factures_dir)
+    return deplaces
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["migrate"]:
+        print("usage : python archive.py migrate [dossier_factures]", file=sys.stderr)
+        return 2
+    deplaces = migrate(argv[1] if len(argv) > 1 else None)
+    print(f"{deplaces} facture(s) rangée(s) par année et mois.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# Cache des ressources de l'entreprise réutilisées d'une facture à l'autre :
+# profil JSON déjà lu et logo réduit, prêt à être intégré au PDF (le logo
+# d'origine lui-même s'il est déjà petit et au format JPEG ou PNG).
+#
+# Les entrées sont indexées par chemin + date de modification + taille : un
+# fichier modifié est relu automatiquement. Les logos réduits sont aussi
+# écrits sur disque (.cache/logos) pour être partagés par les processus de
+# génération.
+import hashlib
+import json
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# Le logo est imprimé sur 33 mm : ~400 px suffisent pour 300 dpi
+LOGO_MAX_PX = 400
+PREVIEW_SIZE = (150, 150)
+
+_profiles = {}
+_logos = {}
+_previews = {}
+
+
+def _key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def invalidate(path=None):
+    # Oublie les entrées d'un fichier (ou toutes si path est None)
+    for cache in (_profiles, _logos, _previews):
+        if path is None:
+            cache.clear()
+        else:
+            cache.pop(os.path.abspath(path), None)
+
+
+def load_profile(path):
+    """Profil de l'entreprise lu depuis `path` ({} s'il n'existe pas)."""
+    key = _key(path)
+    if key is None:
+        return {}
+    cached = _profiles.get(key[0])
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    _profiles[key[0]] = (key, data)
+    return data
+
+
+def logo_for_pdf(path):
+    """Chemin du logo à intégrer au PDF : le logo d'origine s'il est assez petit
+    et dans un format que FPDF intègre tel quel, sinon une version réduite (le
+    logo d'origine si PIL n'est pas installé), None si le logo n'existe pas."""
+    key = _key(path) if path else None
+    if key is None:
+        return None
+    cached = _logos.get(key[0])
+    if cached and cached[0] == key:
+        return cached[1]
+
+    try:
+        from PIL import Image
+    except ImportError:
+        _logos[key[0]] = (key, path)
+        return path
+
+    try:
+        with Image.open(path) as img:
+            cached_path = _reduced_logo(img, path, key)
+    except Exception:
+        cached_path = path
+    _logos[key[0]] = (key, cached_path)
+    return cached_path
+
+
+def _reduced_logo(img, path, key):
+    # Le logo d'origine s'il convient déjà, sinon sa version réduite dans le cache
+    from PIL import Image
+    if max(img.size) <= LOGO_MAX_PX and _embeddable(img):
+        return path
+    # Un JPEG reste un JPEG : FPDF le recopie sans le décoder, sans canal alpha à séparer
+    fmt = "JPEG" if img.format == "JPEG" else "PNG"
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    cached_path = os.path.join(CACHE_DIR, 'logos', f"{digest}.{fmt.lower()}")
+    if os.path.exists(cached_path):
+        return cached_path
+    img.thumbnail((LOGO_MAX_PX, LOGO_MAX_PX), Image.LANCZOS)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    elif fmt == "PNG" and img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    # Écriture atomique : plusieurs processus peuvent remplir le cache
+    tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+    if fmt == "JPEG":
+        img.save(tmp_path, "JPEG", quality=90, optimize=True)
+    else:
+        img.save(tmp_path, "PNG", optimize=True)
+    os.replace(tmp_path, cached_path)
+    return cached_path
+
+
+def _embeddable(img):
+    # Formats que PyFPDF 1.7 comme fpdf2 intègrent sans conversion : JPEG, et
+    # PNG 8 bits non entrelacé
+    if img.format == "JPEG":
+        return img.mode in ("RGB", "L", "CMYK")
+    if img.format == "PNG":
+        return img.mode in ("RGB", "RGBA", "L", "LA", "P") and not img.info.get("interlace")
+    return False
+
+
+def logo_preview(path):
+    """Image PIL du logo redimensionnée pour l'aperçu du profil."""
+    key = _key(path)
+    if key is None:
+        raise FileNotFoundError(path)
+    cached = _previews.get(key[0])
+    if cached and cached[0] == key:
+        return cached[1]
+    from PIL import Image
+    img = Image.open(path)
+    img = img.resize(PREVIEW_SIZE, Image.LANCZOS)
+    _previews[key[0]] = (key, img)
+    return img
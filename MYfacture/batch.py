@@ -0,0 +1,238 @@
+# Génération de factures par lot, sans interface graphique.
+#
+#   python batch.py factures.jsonl --workers 8
+#   python batch.py factures.csv --profil profil_entreprise.json --output factures/
+#
+# JSONL : une facture par ligne, {"Numéro": ..., "Date": "jj/mm/aaaa",
+# "client": {"Nom du client": ...}, "lignes": [{"Produit": ..., ...}]}.
+# CSV : une ligne de produit par enregistrement ; les enregistrements
+# consécutifs de même colonne "Numéro" forment une facture, les champs client
+# sont lus sur la première ligne. Une ligne sans "Numéro" forme une facture à
+# elle seule, numérotée par son numéro de ligne comme en JSONL. Une facture
+# dont le fichier existe déjà (numéro en double) est mise en échec, jamais
+# écrasée.
+#
+# Avec --numeroter, chaque facture reçoit le numéro suivant de la série de son
+# année (voir numbering.py) au lieu du "Numéro" du fichier d'entrée ; les
+# numéros sont réservés par blocs de --bloc.
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import archive
+import assets
+import fonts
+import index
+import numbering
+import render
+import timing
+
+_profil = {}
+
+
+def _init_worker(profil):
+    global _profil
+    _profil = profil
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for numero_ligne, ligne in enumerate(f, 1):
+            if not ligne.strip():
+                continue
+            try:
+                record = json.loads(ligne)
+            except ValueError as e:
+                # Une ligne illisible est signalée sans interrompre le lot
+                yield {"Numéro": f"ligne {numero_ligne}", "erreur": f"JSON invalide : {e}"}
+                continue
+            record.setdefault("Numéro", str(numero_ligne))
+            yield record
+
+
+def read_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = csv.DictReader(f)
+        # Sans numéro (colonne absente ou vide), chaque ligne est une facture à
+        # elle seule, numérotée comme en JSONL par son numéro de ligne : des
+        # lignes sans rapport ne sont jamais réunies
+        lignes = enumerate(rows, start=2)
+        for cle, groupe in itertools.groupby(lignes, key=lambda ligne: ligne[1].get("Numéro") or -ligne[0]):
+            numero_ligne, premiere = next(groupe)
+            groupe = [premiere] + [row for _, row in groupe]
+            yield {
+                "Numéro": premiere.get("Numéro") or str(numero_ligne),
+                "Date": groupe[0].get("Date", ""),
+                "client": {key: groupe[0].get(key, "") for key in render.CLIENT_FIELDS},
+                "lignes": [{key: row.get(key, "") for key in render.LINE_FIELDS} for row in groupe],
+            }
+
+
+def read_records(path):
+    if path.lower().endswith('.csv'):
+        return read_csv(path)
+    return read_jsonl(path)
+
+
+def record_date(record):
+    date = record.get("Date")
+    return datetime.strptime(date, '%d/%m/%Y') if date else datetime.now()
+
+
+def check_record(record):
+    """Vérifie la date, le client et les lignes d'une facture comme au rendu
+    (render.parse_line) ; lève ValueError. Appelé avant d'attribuer un numéro :
+    une facture invalide n'en consomme pas."""
+    try:
+        record_date(record)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Date invalide : {e}")
+    if not isinstance(record.get("client", {}), dict):
+        raise ValueError("Le champ \"client\" est un objet JSON.")
+    lignes = record.get("lignes", [])
+    if not isinstance(lignes, list):
+        raise ValueError("Le champ \"lignes\" est une liste.")
+    for position, ligne in enumerate(lignes, 1):
+        try:
+            _, prix, quantite, tva, remise = render.parse_line(ligne)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Ligne {position} invalide : {e}")
+        if not all(math.isfinite(valeur) for valeur in (prix, tva, remise)):
+            raise ValueError(f"Ligne {position} invalide : montant non fini.")
+
+
+def render_record(record, output_dir, profil=None):
+    # `profil` remplace celui du processus de travail (service HTTP)
+    numero = str(record.get("Numéro", ""))
+    date = record_date(record)
+    nom = record.get("Fichier") or f"facture_{numero}"
+    fichier = f"{render.clean_filename(nom)}.pdf"
+    filename = archive.invoice_path(fichier, date, output_dir)
+    relpath = archive.relative_path(fichier, date)
+    # Fichier réservé par une création exclusive : une facture existante n'est
+    # jamais écrasée, même par deux rendus simultanés du même numéro
+    try:
+        os.close(os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise FileExistsError(f"La facture {relpath} existe déjà.")
+    client = record.get("client", {})
+    try:
+        resultat = render.render_invoice(profil or _profil, client, record.get("lignes", []), filename, date, numero)
+    except BaseException:
+        os.remove(filename)
+        raise
+    return relpath, numero, date, client.get("Nom du client", ""), resultat
+
+
+def index_record(conn, record, relpath, numero, date, client, resultat):
+    # Contenu indexé pour la recherche de l'onglet Historique et les rapports
+    lignes = [render.parse_line(ligne) for ligne in record.get("lignes", [])]
+    index.record_invoice(conn, relpath, numero, date, client, resultat, record.get("client", {}), lignes)
+
+
+def run(path, profil, output_dir, workers=None, max_pending=None, numeroter=False, bloc=100):
+    """Génère toutes les factures de `path` ; retourne (nb réussies, échecs, durée).
+    `numeroter` attribue les numéros de la série, réservés par blocs de `bloc`."""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    # Nombre borné de factures en vol : le fichier d'entrée est lu au fil de l'eau
+    max_pending = max_pending or workers * 4
+    succes = 0
+    echecs = []
+    debut = time.perf_counter()
+
+    # Police réduite et métriques préparées une fois, avant les processus de rendu
+    fonts.prepare(profil)
+    conn = index.connect(output_dir)
+    allocator = numbering.Allocator(output_dir, bloc) if numeroter else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(profil,)) as pool:
+        pending = {}
+
+        def collect(done):
+            nonlocal succes
+            for future in done:
+                record = pending.pop(future)
+                numero = record.get("Numéro", "?")
+                try:
+                    relpath, numero, date, client, resultat = future.result()
+                except Exception as e:
+                    echecs.append((numero, f"{type(e).__name__}: {e}"))
+                    if allocator:
+                        allocator.release(numero)
+                    continue
+                index_record(conn, record, relpath, numero, date, client, resultat)
+                succes += 1
+
+        records = read_records(path)
+        while True:
+            try:
+                record = next(records)
+            except StopIteration:
+                break
+            except Exception as e:
+                echecs.append(("?", f"Entrée illisible : {e}"))
+                break
+            if "erreur" in record:
+                echecs.append((record["Numéro"], record["erreur"]))
+                continue
+            try:
+                check_record(record)
+            except ValueError as e:
+                echecs.append((record.get("Numéro", "?"), str(e)))
+                continue
+            if allocator:
+                # Numéro attribué une fois la facture vérifiée
+                record = {**record, "Numéro": allocator.next(record_date(record))}
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(render_record, record, output_dir)] = record
+        done, _ = wait(pending)
+        collect(done)
+    if allocator:
+        # Les numéros du dernier bloc restés inutilisés sont rendus
+        allocator.close()
+    conn.close()
+
+    return succes, echecs, time.perf_counter() - debut
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération de factures PDF par lot (CSV ou JSONL).")
+    parser.add_argument("input", help="fichier .csv ou .jsonl des factures")
+    parser.add_argument("--profil", default="profil_entreprise.json", help="profil de l'entreprise (JSON)")
+    parser.add_argument("--output", default=archive.FACTURES_DIR, help="archive de sortie des PDF (rangés par année/mois)")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus (défaut : nb de CPU)")
+    parser.add_argument("--timing", metavar="JOURNAL", nargs="?", const=timing.DEFAULT_LOG,
+                        help="journalise la durée de chaque phase (JSON lines)")
+    parser.add_argument("--numeroter", action="store_true",
+                        help="attribue les numéros de la série de l'année (F2026-000001...)")
+    parser.add_argument("--bloc", type=int, default=100, help="numéros réservés à la fois avec --numeroter")
+    args = parser.parse_args(argv)
+
+    if args.timing:
+        # Avant la création des processus, qui héritent de l'environnement
+        timing.enable(args.timing)
+
+    profil = assets.load_profile(args.profil)
+
+    succes, echecs, duree = run(args.input, profil, args.output, args.workers,
+                                numeroter=args.numeroter, bloc=args.bloc)
+
+    total = succes + len(echecs)
+    debit = total / duree if duree > 0 else 0.0
+    print(f"{succes}/{total} factures générées en {duree:.2f} s ({debit:.1f} factures/s)")
+    for numero, erreur in echecs:
+        print(f"  échec facture {numero} : {erreur}", file=sys.stderr)
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
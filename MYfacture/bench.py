@@ -0,0 +1,239 @@
+# Banc d'essai reproductible, sans affichage : totaux, rendu PDF, historique.
+#
+#   python bench.py                          mesures par défaut, résultat JSON dans bench_results/
+#   python bench.py --lines 1,100,10000 --archives 1000,100000 --repeat 5
+#   python bench.py --compare ancien.json nouveau.json
+#
+# Les données (profil, clients, factures, archives) sont synthétiques et
+# générées avec une graine fixe pour que deux exécutions soient comparables.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import index
+import lines
+import totals
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results')
+
+DEFAULT_LINES = [1, 10, 100, 1000, 10000]
+DEFAULT_ARCHIVES = [1000, 10000, 100000]
+
+
+def synthetic_profile():
+    return {
+        "Nom de la société": "Société Banc d'Essai",
+        "Adresse": "1 rue des Mesures, 75000 Paris",
+        "Téléphone": "0100000000",
+        "E-mail": "bench@example.com",
+        "Numéro SIRET": "00000000000000",
+        "Logo": "",
+    }
+
+
+def synthetic_client(rng, i):
+    return {
+        "Nom du client": f"Client {i:05d}",
+        "Adresse client": f"{rng.randint(1, 200)} avenue Synthétique",
+        "Téléphone client": f"06{rng.randint(0, 99999999):08d}",
+        "E-mail client": f"client{i}@example.com",
+        "N° TVA client": f"FR{rng.randint(0, 99999999999):011d}",
+    }
+
+
+def synthetic_lines(rng, n):
+    # (produit, prix HT, quantité, TVA %, remise %)
+    return [
+        (f"Produit {rng.randint(1, 5000)}", round(rng.uniform(0.5, 500), 2), rng.randint(1, 20),
+         rng.choice([20.0, 10.0, 5.5, 2.1]), rng.choice([0.0, 0.0, 5.0, 10.0]))
+        for _ in range(n)
+    ]
+
+
+def measure(func, repeat):
+    durees = []
+    for _ in range(repeat):
+        debut = time.perf_counter()
+        func()
+        durees.append(time.perf_counter() - debut)
+    return {"min_s": min(durees), "median_s": statistics.median(durees), "repeat": repeat}
+
+
+def bench_totals(lignes, repeat):
+    colonnes = list(zip(*lignes))
+    # Lignes telles que stockées dans le Treeview (chaînes formatées)
+    formatees = [(p, f"{prix:.2f}", q, f"{tva:.2f}", f"{remise:.2f}") for p, prix, q, tva, remise in lignes]
+
+    def parse_and_total():
+        prix, quantites, tvas, remises = [], [], [], []
+        for vals in formatees:
+            prix.append(float(vals[1]))
+            quantites.append(int(vals[2]))
+            tvas.append(float(vals[3]))
+            remises.append(float(vals[4]))
+        totals.compute_totals(prix, quantites, tvas, remises)
+
+    def running():
+        # Ajout ligne à ligne dans le stockage compact, comme add_product_line
+        store = lines.LineStore()
+        for ligne in lignes:
+            store.append(*ligne)
+        store.totals()
+
+    store = lines.LineStore()
+    for ligne in lignes:
+        store.append(*ligne)
+
+    return {
+        "compute_totals": measure(lambda: totals.compute_totals(*colonnes[1:]), repeat),
+        "update_totals_parse": measure(parse_and_total, repeat),
+        "add_product_line_running": measure(running, repeat),
+        "line_store_recompute": measure(store.recompute, repeat),
+    }
+
+
+def bench_render(profil, client, lignes, repeat, workdir):
+    try:
+        import render
+    except ImportError as e:
+        return {"skipped": f"fpdf indisponible : {e}"}
+    filename = os.path.join(workdir, "bench.pdf")
+    resultat = measure(lambda: render.render_invoice(profil, client, lignes, filename), repeat)
+    resultat["pdf_bytes"] = os.path.getsize(filename)
+    return resultat
+
+
+def bench_history(rng, nb_factures, repeat, workdir):
+    dossier = os.path.join(workdir, f"archive_{nb_factures}")
+    os.makedirs(dossier)
+    conn = index.connect(dossier)
+    debut = datetime(2020, 1, 1)
+    rows = []
+    for i in range(nb_factures):
+        fichier = f"facture_{i:06d}.pdf"
+        open(os.path.join(dossier, fichier), 'wb').close()
+        ht = rng.randint(100, 10 ** 6)
+        rows.append((fichier, str(i), index._iso(debut + timedelta(minutes=17 * i)),
+                     f"Client {rng.randint(0, 2000):05d}", ht, ht * 12 // 10))
+    with conn:
+        # Colonnes nommées comme dans index.record_invoice, en une seule transaction
+        conn.executemany("INSERT INTO factures (fichier, numero, date, client, total_ht, total_ttc) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def scan_folder():
+        # Ancien chargement : listdir + date de création de chaque PDF
+        for filename in os.listdir(dossier):
+            if filename.endswith('.pdf'):
+                os.path.getctime(os.path.join(dossier, filename))
+
+    def index_window():
+        # Chargement actuel : comptage + première fenêtre visible
+        index.count_invoices(conn)
+        index.page_invoices(conn, limit=50)
+
+    def index_filtered_sorted():
+        filtres = {"client": "Client 01"}
+        index.count_invoices(conn, filtres)
+        index.page_invoices(conn, filtres, tri="Total TTC", descendant=True, offset=200, limit=50)
+
+    resultat = {
+        "scan_folder": measure(scan_folder, repeat),
+        "index_first_window": measure(index_window, repeat),
+        "index_filtered_sorted": measure(index_filtered_sorted, repeat),
+    }
+    conn.close()
+    shutil.rmtree(dossier)
+    return resultat
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": totals.load_numpy() is not None,
+    }
+
+
+def run(tailles, archives, repeat, seed=0):
+    rng = random.Random(seed)
+    profil = synthetic_profile()
+    client = synthetic_client(rng, 0)
+    resultats = {"environment": environment(), "totals": {}, "render": {}, "history": {}}
+    workdir = tempfile.mkdtemp(prefix="myfacture_bench_")
+    try:
+        for n in tailles:
+            lignes = synthetic_lines(rng, n)
+            resultats["totals"][str(n)] = bench_totals(lignes, repeat)
+            resultats["render"][str(n)] = bench_render(profil, client, lignes, repeat, workdir)
+            print(f"  {n} ligne(s) mesurée(s)", file=sys.stderr)
+        for n in archives:
+            resultats["history"][str(n)] = bench_history(rng, n, repeat, workdir)
+            print(f"  archive de {n} facture(s) mesurée(s)", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return resultats
+
+
+def _flatten(data, prefix=""):
+    for key, value in data.items():
+        if isinstance(value, dict) and "min_s" in value:
+            yield f"{prefix}{key}", value["min_s"]
+        elif isinstance(value, dict) and key != "environment":
+            yield from _flatten(value, f"{prefix}{key}/")
+
+
+def compare(ancien, nouveau):
+    with open(ancien, 'r', encoding='utf-8') as f:
+        avant = dict(_flatten(json.load(f)))
+    with open(nouveau, 'r', encoding='utf-8') as f:
+        apres = dict(_flatten(json.load(f)))
+    for cle in sorted(avant.keys() & apres.keys()):
+        ratio = apres[cle] / avant[cle] if avant[cle] else float('inf')
+        print(f"{cle:<50} {avant[cle] * 1000:10.3f} ms -> {apres[cle] * 1000:10.3f} ms  x{ratio:.2f}")
+
+
+def _sizes(text):
+    return [int(v) for v in text.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai MYfacture (totaux, PDF, historique).")
+    parser.add_argument("--lines", type=_sizes, default=DEFAULT_LINES, help="tailles de facture, ex. 1,100,10000")
+    parser.add_argument("--archives", type=_sizes, default=DEFAULT_ARCHIVES, help="tailles d'archive, ex. 1000,100000")
+    parser.add_argument("--repeat", type=int, default=3, help="répétitions par mesure (le minimum est retenu)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="fichier JSON de sortie (défaut : bench_results/bench_<date>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("ANCIEN", "NOUVEAU"), help="compare deux résultats JSON")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    resultats = run(args.lines, args.archives, args.repeat, args.seed)
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(resultats, f, ensure_ascii=False, indent=4)
+    print(f"Résultats enregistrés dans {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
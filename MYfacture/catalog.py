@@ -0,0 +1,230 @@
+# Catalogue de produits (référence, libellé, prix unitaire HT, TVA par défaut)
+# enregistré dans catalogue.sqlite, avec un index de recherche en mémoire pour
+# l'autocomplétion du champ Produit.
+#
+#   python catalog.py import produits.csv
+#
+# Colonnes CSV acceptées : reference/Référence, libelle/Libellé,
+# prix/Prix Unitaire HT, tva/TVA (%) (facultative : taux par défaut).
+import csv
+import os
+import sqlite3
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogue.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS produits (
+    reference TEXT PRIMARY KEY,
+    libelle TEXT NOT NULL,
+    prix REAL NOT NULL,
+    tva REAL NOT NULL
+);
+"""
+
+CSV_COLUMNS = {
+    "reference": ("reference", "référence", "ref"),
+    "libelle": ("libelle", "libellé", "produit"),
+    "prix": ("prix", "prix unitaire ht"),
+    "tva": ("tva", "tva (%)"),
+}
+
+IMPORT_CHUNK = 5000
+FUZZY_CANDIDATES = 3000
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or CATALOG_FILE, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def normalize(text):
+    # Minuscules sans accents : "Café Crème" -> "cafe creme"
+    text = str(text).lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _number(value):
+    return float(str(value).strip().replace(',', '.') or 0)
+
+
+def import_csv(csv_path, path=None, default_tva=20.0):
+    """Importe (ou met à jour) les produits d'un CSV par paquets ; retourne le nombre lu."""
+    conn = connect(path)
+    total = 0
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        colonnes = {}
+        for champ, noms in CSV_COLUMNS.items():
+            for header in reader.fieldnames or []:
+                if header.strip().lower() in noms:
+                    colonnes[champ] = header
+        if "reference" not in colonnes or "libelle" not in colonnes or "prix" not in colonnes:
+            raise ValueError("Le CSV doit contenir au moins les colonnes référence, libellé et prix.")
+        colonne_tva = colonnes.get("tva")
+
+        paquet = []
+        with conn:
+            for row in reader:
+                paquet.append((
+                    row[colonnes["reference"]].strip(),
+                    row[colonnes["libelle"]].strip(),
+                    _number(row[colonnes["prix"]] or 0),
+                    # Sans colonne TVA, le taux par défaut
+                    _number((row[colonne_tva] if colonne_tva else "") or default_tva),
+                ))
+                if len(paquet) >= IMPORT_CHUNK:
+                    conn.executemany("INSERT OR REPLACE INTO produits VALUES (?, ?, ?, ?)", paquet)
+                    total += len(paquet)
+                    paquet = []
+            conn.executemany("INSERT OR REPLACE INTO produits VALUES (?, ?, ?, ?)", paquet)
+            total += len(paquet)
+    conn.close()
+    return total
+
+
+class Catalog:
+    """Catalogue chargé en mémoire avec un index de recherche.
+
+    Recherche par préfixe (référence, libellé ou l'un de ses mots) par
+    dichotomie dans une liste triée ; si elle ne suffit pas, recherche
+    approchée par trigrammes une fois l'index construit par build_trigrams.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        conn = connect(self.path)
+        self.produits = conn.execute("SELECT reference, libelle, prix, tva FROM produits ORDER BY reference").fetchall()
+        conn.close()
+        cles = []
+        for i, (reference, libelle, _, _) in enumerate(self.produits):
+            cles.append((normalize(reference), i))
+            libelle = normalize(libelle)
+            cles.append((libelle, i))
+            for mot in libelle.split()[1:]:
+                cles.append((mot, i))
+        cles.sort()
+        self.cles = cles
+        self.trigrammes = None
+
+    def __len__(self):
+        return len(self.produits)
+
+    def _prefix(self, requete, limit, trouves):
+        pos = bisect_left(self.cles, (requete,))
+        while pos < len(self.cles) and len(trouves) < limit:
+            cle, i = self.cles[pos]
+            if not cle.startswith(requete):
+                break
+            if i not in trouves:
+                trouves.append(i)
+            pos += 1
+
+    def _words(self, mots, limit, trouves):
+        # Requête de plusieurs mots dans un ordre quelconque : produits dont chaque
+        # mot de la requête commence un mot de la référence ou du libellé
+        communs = None
+        for mot in sorted(mots, key=len, reverse=True):
+            ids = set()
+            pos = bisect_left(self.cles, (mot,))
+            while pos < len(self.cles) and self.cles[pos][0].startswith(mot):
+                ids.add(self.cles[pos][1])
+                pos += 1
+            communs = ids if communs is None else communs & ids
+            if not communs:
+                return
+        for i in sorted(communs):
+            if len(trouves) >= limit:
+                break
+            if i not in trouves:
+                trouves.append(i)
+
+    @staticmethod
+    def _grams(texte):
+        texte = f"  {texte} "
+        return {texte[i:i + 3] for i in range(len(texte) - 2)}
+
+    def build_trigrams(self):
+        # Peut être appelé dans un thread après le chargement, avant la première saisie
+        index = {}
+        for i, (reference, libelle, _, _) in enumerate(self.produits):
+            for gram in self._grams(normalize(f"{reference} {libelle}")):
+                postings = index.get(gram)
+                if postings is None:
+                    postings = index[gram] = array('l')
+                postings.append(i)
+        self.trigrammes = index
+
+    def _fuzzy(self, requete, limit, trouves):
+        if self.trigrammes is None:
+            return
+        # Candidats classés par nombre de trigrammes communs avec la requête.
+        # Les trigrammes sont parcourus du plus rare au plus fréquent : les plus
+        # rares désignent au plus FUZZY_CANDIDATES candidats, les suivants ne font
+        # qu'ajouter un point aux candidats déjà trouvés (recherche par dichotomie
+        # dans la liste triée). Le coût ne dépend pas de la taille du catalogue ;
+        # une requête dont même le trigramme le plus rare est très courant ne
+        # retient que les premiers candidats.
+        grams = sorted(self._grams(requete), key=lambda gram: len(self.trigrammes.get(gram, ())))
+        scores = Counter()
+        for gram in grams:
+            postings = self.trigrammes.get(gram, ())
+            place = FUZZY_CANDIDATES - len(scores)
+            if place > 0 and (len(postings) <= place or not scores):
+                scores.update(postings[:place])
+                continue
+            for i in scores:
+                pos = bisect_left(postings, i)
+                if pos < len(postings) and postings[pos] == i:
+                    scores[i] += 1
+        minimum = max(1, len(grams) // 2)
+        for i, score in scores.most_common(limit * 2):
+            if score < minimum or len(trouves) >= limit:
+                break
+            if i not in trouves:
+                trouves.append(i)
+
+    def search(self, texte, limit=10):
+        """Produits correspondant à `texte` : [(référence, libellé, prix, tva)]."""
+        requete = normalize(texte).strip()
+        if not requete:
+            return []
+        trouves = []
+        self._prefix(requete, limit, trouves)
+        mots = requete.split()
+        if len(trouves) < limit and len(mots) > 1:
+            self._words(mots, limit, trouves)
+        if len(trouves) < limit and len(requete) >= 3:
+            self._fuzzy(requete, limit, trouves)
+        return [self.produits[i] for i in trouves]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != "import":
+        print("usage : python catalog.py import produits.csv", file=sys.stderr)
+        return 2
+    total = import_csv(argv[1])
+    print(f"{total} produit(s) importé(s) dans {CATALOG_FILE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
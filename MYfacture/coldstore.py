@@ -0,0 +1,366 @@
+# Stockage froid des anciennes factures : compressées et dédupliquées dans
+# des paquets (factures/froid/paquet_000001.pack), avec un index pour l'accès
+# direct à une facture.
+#
+#   python coldstore.py archiver --age 365     range les factures de plus d'un an
+#   python coldstore.py extraire 2024/03/facture_F2024-000012.pdf copie.pdf
+#
+# Chaque PDF est découpé en blocs aux limites des objets PDF ("12 0 obj") :
+# le logo, les polices et les textes fixes d'un profil donnent les mêmes blocs
+# d'une facture à l'autre et ne sont stockés qu'une fois. Chaque bloc est
+# compressé séparément (zlib) : lire une facture ne décompresse que ses blocs.
+# L'index des factures garde les factures archivées, qui restent consultables
+# depuis l'Historique (voir materialize).
+#
+# L'emplacement des blocs est aussi écrit dans froid/manifeste.jsonl, avec la
+# ligne d'index et le contenu de chaque facture archivée : l'index n'est qu'un
+# cache, `index.py rebuild` le reconstruit depuis ce manifeste (voir restore).
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+from datetime import datetime, timedelta
+
+import archive
+
+COLD_DIR_NAME = "froid"
+MANIFEST_NAME = "manifeste.jsonl"
+EXTRACT_DIR_NAME = "extraits"
+# Copies extraites gardées pour être rouvertes ; les plus anciennes sont supprimées
+EXTRACT_KEEP = 20
+PACK_MAX = 256 * 1024 * 1024
+DEFAULT_AGE_DAYS = 365
+# Blocs de taille bornée pour les fichiers qui ne sont pas découpés en objets
+MAX_CHUNK = 256 * 1024
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocs (
+    empreinte BLOB PRIMARY KEY,
+    paquet INTEGER,
+    position INTEGER,
+    taille INTEGER
+);
+CREATE TABLE IF NOT EXISTS froids (
+    fichier TEXT PRIMARY KEY,
+    dossier TEXT,
+    blocs BLOB,
+    taille INTEGER,
+    empreinte BLOB
+);
+CREATE INDEX IF NOT EXISTS froids_dossier ON froids (dossier);
+"""
+
+DIGEST_SIZE = 20
+_OBJECT = re.compile(rb"\d+ \d+ obj\b")
+
+
+def cold_dir(factures_dir=None):
+    return os.path.join(factures_dir or archive.FACTURES_DIR, COLD_DIR_NAME)
+
+
+def pack_path(numero, factures_dir=None):
+    return os.path.join(cold_dir(factures_dir), f"paquet_{numero:06d}.pack")
+
+
+def manifest_path(factures_dir=None):
+    return os.path.join(cold_dir(factures_dir), MANIFEST_NAME)
+
+
+def chunks(data):
+    """Découpe un PDF en blocs : l'en-tête de chaque objet ("12 0 obj", dont
+    le numéro varie d'une facture à l'autre) est séparé de son contenu."""
+    coupures = []
+    for match in _OBJECT.finditer(data):
+        coupures.extend(match.span())
+    debut = 0
+    for fin in coupures + [len(data)]:
+        while fin - debut > MAX_CHUNK:
+            yield data[debut:debut + MAX_CHUNK]
+            debut += MAX_CHUNK
+        if fin > debut:
+            yield data[debut:fin]
+            debut = fin
+
+
+def is_cold(conn, relpath):
+    return conn.execute("SELECT 1 FROM froids WHERE fichier = ?", (relpath,)).fetchone() is not None
+
+
+def cold_in(conn, reldir):
+    # Factures archivées qui étaient rangées dans `reldir`
+    return {row[0] for row in conn.execute("SELECT fichier FROM froids WHERE dossier = ?", (reldir,))}
+
+
+def read(conn, relpath, factures_dir=None):
+    """Contenu d'une facture archivée (None si elle ne l'est pas) : seuls ses
+    blocs sont lus et décompressés."""
+    row = conn.execute("SELECT blocs, empreinte FROM froids WHERE fichier = ?", (relpath,)).fetchone()
+    if row is None:
+        return None
+    empreintes, empreinte = row
+    parties = []
+    paquets = {}
+    try:
+        for i in range(0, len(empreintes), DIGEST_SIZE):
+            paquet, position, taille = conn.execute(
+                "SELECT paquet, position, taille FROM blocs WHERE empreinte = ?",
+                (empreintes[i:i + DIGEST_SIZE],)).fetchone()
+            f = paquets.get(paquet)
+            if f is None:
+                f = paquets[paquet] = open(pack_path(paquet, factures_dir), 'rb')
+            f.seek(position)
+            parties.append(zlib.decompress(f.read(taille)))
+    finally:
+        for f in paquets.values():
+            f.close()
+    data = b"".join(parties)
+    if hashlib.sha1(data).digest() != empreinte:
+        raise IOError(f"Facture archivée corrompue : {relpath}")
+    return data
+
+
+def materialize(relpath, factures_dir=None, conn=None):
+    """Chemin lisible d'une facture : le PDF de l'archive s'il est sur disque,
+    sinon une copie extraite du stockage froid dans froid/extraits (None si la
+    facture est introuvable). Seules les EXTRACT_KEEP dernières copies sont gardées."""
+    path = archive.resolve(relpath, factures_dir)
+    if os.path.exists(path):
+        return path
+    extraits = os.path.join(cold_dir(factures_dir), EXTRACT_DIR_NAME)
+    copie = os.path.join(extraits, *relpath.split('/'))
+    if os.path.exists(copie):
+        # Le contenu d'une facture archivée ne change plus
+        return copie
+    import index
+
+    fermer = conn is None
+    conn = conn or index.connect(factures_dir)
+    try:
+        data = read(conn, relpath, factures_dir)
+    finally:
+        if fermer:
+            conn.close()
+    if data is None:
+        return None
+    os.makedirs(os.path.dirname(copie), exist_ok=True)
+    tmp = f"{copie}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, copie)
+    _evict(extraits)
+    return copie
+
+
+def _evict(extraits):
+    copies = []
+    for dossier, _, noms in os.walk(extraits):
+        for nom in noms:
+            chemin = os.path.join(dossier, nom)
+            try:
+                copies.append((os.stat(chemin).st_mtime_ns, chemin))
+            except FileNotFoundError:
+                pass
+    copies.sort(reverse=True)
+    for _, chemin in copies[EXTRACT_KEEP:]:
+        try:
+            os.remove(chemin)
+        except OSError:
+            # Copie encore ouverte par le lecteur PDF (Windows) : supprimée plus tard
+            pass
+
+
+class _PackWriter:
+    # Ajoute les blocs compressés au dernier paquet, un nouveau au-delà de PACK_MAX,
+    # et leur emplacement au manifeste
+
+    def __init__(self, conn, factures_dir):
+        self.conn = conn
+        self.factures_dir = factures_dir
+        os.makedirs(cold_dir(factures_dir), exist_ok=True)
+        self.numero = conn.execute("SELECT COALESCE(MAX(paquet), 1) FROM blocs").fetchone()[0]
+        self.file = open(pack_path(self.numero, factures_dir), 'ab')
+        self.manifest = open(manifest_path(factures_dir), 'a', encoding='utf-8')
+
+    def add(self, data):
+        empreinte = hashlib.sha1(data).digest()
+        if self.conn.execute("SELECT 1 FROM blocs WHERE empreinte = ?", (empreinte,)).fetchone():
+            return empreinte, 0
+        if self.file.tell() > PACK_MAX:
+            self.file.close()
+            self.numero += 1
+            self.file = open(pack_path(self.numero, self.factures_dir), 'ab')
+        compresse = zlib.compress(data, 9)
+        position = self.file.tell()
+        self.file.write(compresse)
+        self.conn.execute("INSERT INTO blocs VALUES (?, ?, ?, ?)", (empreinte, self.numero, position, len(compresse)))
+        self._note({"bloc": [empreinte.hex(), self.numero, position, len(compresse)]})
+        return empreinte, len(compresse)
+
+    def add_invoice(self, relpath, empreintes, data):
+        import search
+
+        empreinte = hashlib.sha1(data).digest()
+        self.conn.execute("INSERT INTO froids VALUES (?, ?, ?, ?, ?)",
+                          (relpath, relpath.rpartition('/')[0], b"".join(empreintes), len(data), empreinte))
+        ligne = self.conn.execute(
+            "SELECT numero, date, client, total_ht, total_ttc FROM factures WHERE fichier = ?", (relpath,)).fetchone()
+        self._note({"facture": {
+            "fichier": relpath, "blocs": b"".join(empreintes).hex(), "taille": len(data), "empreinte": empreinte.hex(),
+            "index": ligne, "contenu": search.load_content(self.conn, relpath),
+        }})
+
+    def _note(self, record):
+        self.manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sync(self):
+        # Blocs et manifeste sur disque avant que l'index ne les référence
+        for f in (self.file, self.manifest):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        self.manifest.close()
+
+
+def pack(factures_dir=None, age_jours=DEFAULT_AGE_DAYS, progress=None):
+    """Archive dans le stockage froid les factures de plus de `age_jours` jours
+    encore présentes sur disque, puis supprime leur PDF une fois relu et
+    vérifié. Retourne (nb archivées, octets d'origine, octets ajoutés aux paquets)."""
+    import index
+
+    conn = index.connect(factures_dir)
+    limite = (datetime.now() - timedelta(days=age_jours)).strftime('%Y-%m-%d %H:%M:%S')
+    candidats = [row[0] for row in conn.execute(
+        "SELECT fichier FROM factures WHERE date < ? AND fichier NOT IN (SELECT fichier FROM froids) "
+        "ORDER BY date", (limite,))]
+    writer = _PackWriter(conn, factures_dir)
+    archivees, avant, ajoutes = 0, 0, 0
+    a_supprimer = []
+
+    def valider():
+        # Paquet sur disque, index validé, contenu relu : le PDF d'origine peut partir
+        writer.sync()
+        conn.commit()
+        for relpath, path, data in a_supprimer:
+            if read(conn, relpath, factures_dir) == data:
+                os.remove(path)
+        with conn:
+            conn.executemany("DELETE FROM fichiers WHERE fichier = ?", [(r,) for r, _, _ in a_supprimer])
+        a_supprimer.clear()
+
+    try:
+        for relpath in candidats:
+            path = archive.resolve(relpath, factures_dir)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            empreintes = []
+            for bloc in chunks(data):
+                empreinte, taille = writer.add(bloc)
+                empreintes.append(empreinte)
+                ajoutes += taille
+            writer.add_invoice(relpath, empreintes, data)
+            a_supprimer.append((relpath, path, data))
+            archivees += 1
+            avant += len(data)
+            if len(a_supprimer) >= COMMIT_EVERY:
+                valider()
+                if progress:
+                    progress(archivees, len(candidats))
+        valider()
+    finally:
+        writer.close()
+        conn.close()
+    if progress:
+        progress(archivees, len(candidats))
+    return archivees, avant, ajoutes
+
+
+def restore(conn, factures_dir=None):
+    """Recharge dans l'index, depuis le manifeste, les blocs et les factures du
+    stockage froid qui n'y sont plus (index perdu ou reconstruit). Retourne le
+    nombre de factures ajoutées à l'index."""
+    import reports
+    import search
+
+    try:
+        f = open(manifest_path(factures_dir), 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return 0
+    ajoutees = 0
+    with f, conn:
+        for ligne in f:
+            try:
+                record = json.loads(ligne)
+            except ValueError:
+                # Dernier enregistrement tronqué : ses blocs n'ont jamais été validés
+                break
+            if "bloc" in record:
+                empreinte, paquet, position, taille = record["bloc"]
+                conn.execute("INSERT OR IGNORE INTO blocs VALUES (?, ?, ?, ?)",
+                             (bytes.fromhex(empreinte), paquet, position, taille))
+                continue
+            facture = record["facture"]
+            relpath = facture["fichier"]
+            conn.execute("INSERT OR IGNORE INTO froids VALUES (?, ?, ?, ?, ?)",
+                         (relpath, relpath.rpartition('/')[0], bytes.fromhex(facture["blocs"]),
+                          facture["taille"], bytes.fromhex(facture["empreinte"])))
+            if facture["index"] is None or conn.execute(
+                    "SELECT 1 FROM factures WHERE fichier = ?", (relpath,)).fetchone():
+                continue
+            numero, date, client, total_ht, total_ttc = facture["index"]
+            conn.execute("INSERT INTO factures (fichier, numero, date, client, total_ht, total_ttc) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (relpath, numero, date, client, total_ht, total_ttc))
+            contenu = facture["contenu"]
+            if contenu is not None:
+                search.record_content(conn, relpath, contenu["client"], contenu["lignes"])
+                reports.record(conn, relpath, datetime.strptime(date, '%Y-%m-%d %H:%M:%S'), client,
+                               contenu["lignes"])
+            ajoutees += 1
+    return ajoutees
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stockage froid compressé des anciennes factures.")
+    sub = parser.add_subparsers(dest="commande", required=True)
+    archiver = sub.add_parser("archiver", help="archive les factures plus anciennes que --age jours")
+    archiver.add_argument("--age", type=int, default=DEFAULT_AGE_DAYS, help=f"âge minimal en jours (défaut : {DEFAULT_AGE_DAYS})")
+    archiver.add_argument("--factures", help="dossier de l'archive (défaut : factures/)")
+    extraire = sub.add_parser("extraire", help="extrait une facture archivée")
+    extraire.add_argument("fichier", help="chemin relatif, ex. 2024/03/facture_F2024-000012.pdf")
+    extraire.add_argument("destination")
+    extraire.add_argument("--factures", help="dossier de l'archive (défaut : factures/)")
+    args = parser.parse_args(argv)
+
+    if args.commande == "archiver":
+        def progress(fait, total):
+            print(f"\r  {fait}/{total} facture(s)", end="", file=sys.stderr, flush=True)
+
+        archivees, avant, ajoutes = pack(args.factures, args.age, progress)
+        print(file=sys.stderr)
+        print(f"{archivees} facture(s) archivée(s) : {avant / 1e6:.1f} Mo -> {ajoutes / 1e6:.1f} Mo ajoutés aux paquets")
+        return 0
+
+    import index
+    conn = index.connect(args.factures)
+    data = read(conn, args.fichier, args.factures)
+    conn.close()
+    if data is None:
+        print(f"Facture absente du stockage froid : {args.fichier}", file=sys.stderr)
+        return 1
+    with open(args.destination, 'wb') as f:
+        f.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# Journal du brouillon de la facture en cours (onglet "Nouvelle Facture").
+#
+# Chaque modification (ligne ajoutée, lignes supprimées, champ client modifié)
+# est ajoutée en fin de journal sous la forme d'un petit enregistrement JSON :
+# le coût d'une sauvegarde ne dépend pas de la taille de la facture. Au
+# démarrage, le brouillon est reconstruit en rejouant le journal. Quand le
+# journal a grossi d'autant d'enregistrements que la facture a de lignes (et
+# d'au moins COMPACT_MIN), il est réécrit en un seul état complet : le coût
+# de ce compactage, réparti sur les modifications, reste constant par
+# modification.
+#
+#   {"etat": {"client": {...}, "lignes": [[id, produit, prix, qté, tva, remise], ...], "suivant": n}}
+#   {"ajout": [id, produit, prix, qté, tva, remise]}
+#   {"suppression": [id, ...]}
+#   {"client": [champ, valeur]}
+import json
+import os
+
+COMPACT_MIN = 200
+
+
+class DraftJournal:
+    """Journal en ajout seul du brouillon : lignes (LineStore) et champs client."""
+
+    def __init__(self, path, lines, compact_min=COMPACT_MIN):
+        self.path = path
+        self.lines = lines
+        self.client = {}
+        self.compact_min = compact_min
+        self.records = 0
+        # Nombre de modifications depuis l'ouverture : permet de savoir si le
+        # brouillon a changé depuis un instant donné (voir main.generate_pdf)
+        self.edits = 0
+        self.file = None
+
+    def load(self):
+        """Rejoue le journal dans `self.lines` et retourne les champs client.
+        Un dernier enregistrement tronqué (arrêt pendant l'écriture) est ignoré."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for ligne in f:
+                    try:
+                        record = json.loads(ligne)
+                    except ValueError:
+                        break
+                    self._apply(record)
+                    self.records += 1
+        except FileNotFoundError:
+            pass
+        # Repartir d'un journal propre, sans l'éventuel enregistrement tronqué
+        self.compact()
+        return dict(self.client)
+
+    def _apply(self, record):
+        if "ajout" in record:
+            self._add(*record["ajout"])
+        elif "suppression" in record:
+            for line_id in record["suppression"]:
+                try:
+                    self.lines.remove(line_id)
+                except KeyError:
+                    pass
+        elif "client" in record:
+            champ, valeur = record["client"]
+            self.client[champ] = valeur
+        elif "etat" in record:
+            etat = record["etat"]
+            self.lines.clear()
+            for ligne in etat["lignes"]:
+                self._add(*ligne)
+            self.lines.next_id = etat["suivant"]
+            self.client = dict(etat["client"])
+
+    def _add(self, line_id, produit, prix, quantite, tva, remise):
+        # Même identifiant qu'à la saisie : les suppressions suivantes y font référence
+        self.lines.next_id = line_id
+        self.lines.append(produit, prix, quantite, tva, remise)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Vidé à chaque modification : un plantage de l'application ne perd rien
+        self.file.flush()
+        self.records += 1
+        self.edits += 1
+        if self.records > max(self.compact_min, len(self.lines)):
+            self.compact()
+
+    def added(self, line_id):
+        pos = self.lines.position(line_id)
+        self._write({"ajout": [line_id, self.lines.produits[pos], self.lines.prix[pos],
+                               self.lines.quantites[pos], self.lines.tvas[pos], self.lines.remises[pos]]})
+
+    def removed(self, line_ids):
+        self._write({"suppression": list(line_ids)})
+
+    def client_changed(self, champ, valeur):
+        if self.client.get(champ, "") == valeur:
+            return
+        self.client[champ] = valeur
+        self._write({"client": [champ, valeur]})
+
+    def clear(self):
+        # Facture émise ou abandonnée : le brouillon repart vide
+        self.lines.clear()
+        self.client = {}
+        self.edits += 1
+        self.compact()
+
+    def compact(self):
+        """Réécrit le journal en un seul enregistrement d'état, de façon atomique."""
+        if self.file is not None:
+            self.file.close()
+        lignes = [[self.lines.ids[pos], *self.lines.row(pos)[1:6]] for pos in range(len(self.lines))]
+        etat = {"client": self.client, "lignes": lignes, "suivant": self.lines.next_id}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"etat": etat}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.records = 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
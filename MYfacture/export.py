@@ -0,0 +1,209 @@
+# Export groupé de factures de l'archive dans une archive ZIP ou un seul PDF.
+#
+#   python export.py zip T3_2026.zip --trimestre 2026-3
+#   python export.py pdf janvier.pdf --du 01/01/2026 --au 31/01/2026
+#   python export.py zip lot.zip --numeros F2026-000100-F2026-000199
+#
+# Les factures sont lues une à une au fil d'un curseur de l'index et copiées
+# par blocs dans le ZIP : la mémoire utilisée ne dépend pas du nombre de
+# factures. Les factures du stockage froid (coldstore.py) sont extraites en
+# mémoire une à une.
+#
+# Dépendance facultative : pypdf, pour la fusion en PDF (pip install pypdf).
+# Au-delà de PDF_VOLUME factures, le PDF est découpé en volumes numérotés.
+import argparse
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime, timedelta
+
+import archive
+import coldstore
+import index
+import numbering
+
+FORMATS = ("zip", "pdf")
+PROGRESS_EVERY = 100
+PDF_VOLUME = 500
+
+
+def export(path, fmt, filtres=None, factures_dir=None, progress=None, cancel=None):
+    """Exporte les factures correspondant à `filtres` (voir index._where) dans
+    `path`, par date croissante. `progress(fait, total)` est appelé toutes les
+    PROGRESS_EVERY factures et à la fin ; `cancel()` vrai interrompt l'export.
+    Retourne (nb exportées, nb de fichiers manquants, fichiers écrits) : `path`
+    seul, ou ses volumes path_001.pdf... (voir _to_pdf)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    conn = index.connect(factures_dir)
+    total = index.count_invoices(conn, filtres)
+    fichiers = (row[0] for row in index.iter_invoices(conn, filtres))
+    # Écriture dans des fichiers temporaires : un export interrompu ne laisse pas de fichier incomplet
+    partiels = []
+    try:
+        if fmt == "zip":
+            partiels.append((path + ".part", path))
+            exportees, manquants = _to_zip(path + ".part", conn, fichiers, total, factures_dir, progress, cancel)
+        else:
+            exportees, manquants = _to_pdf(path, partiels, conn, fichiers, total, factures_dir, progress, cancel)
+        ecrits = []
+        for partiel, final in partiels:
+            if cancel and cancel():
+                os.remove(partiel)
+            else:
+                os.replace(partiel, final)
+                ecrits.append(final)
+    except BaseException:
+        for partiel, _ in partiels:
+            if os.path.exists(partiel):
+                os.remove(partiel)
+        raise
+    finally:
+        conn.close()
+    return exportees, manquants, ecrits
+
+
+def _each(conn, fichiers, total, factures_dir, progress, cancel, compte):
+    # (chemin relatif, chemin complet, None) des factures présentes sur disque,
+    # (chemin relatif, None, contenu) de celles du stockage froid ; les
+    # introuvables sont comptées dans compte["manquants"]
+    fait = 0
+    for relpath in fichiers:
+        if cancel and cancel():
+            return
+        chemin = archive.resolve(relpath, factures_dir)
+        if os.path.exists(chemin):
+            yield relpath, chemin, None
+        else:
+            contenu = coldstore.read(conn, relpath, factures_dir)
+            if contenu is None:
+                compte["manquants"] += 1
+            else:
+                yield relpath, None, contenu
+        fait += 1
+        if progress and fait % PROGRESS_EVERY == 0:
+            progress(fait, total)
+    if progress:
+        progress(fait, total)
+
+
+def _to_zip(path, conn, fichiers, total, factures_dir, progress, cancel):
+    compte = {"manquants": 0}
+    exportees = 0
+    # Les PDF sont déjà compressés : stockés tels quels, sans recompression
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for relpath, chemin, contenu in _each(conn, fichiers, total, factures_dir, progress, cancel, compte):
+            if contenu is None:
+                zf.write(chemin, arcname=relpath)
+            else:
+                zf.writestr(relpath, contenu)
+            exportees += 1
+    return exportees, compte["manquants"]
+
+
+def volume_path(path, numero):
+    # "janvier.pdf" -> "janvier_001.pdf"
+    base, ext = os.path.splitext(path)
+    return f"{base}_{numero:03d}{ext or '.pdf'}"
+
+
+def _to_pdf(path, partiels, conn, fichiers, total, factures_dir, progress, cancel):
+    # pypdf garde en mémoire toutes les pages jusqu'à l'écriture : au-delà de
+    # PDF_VOLUME factures, l'export est découpé en volumes janvier_001.pdf,
+    # janvier_002.pdf... écrits au fur et à mesure, la mémoire reste bornée.
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        raise RuntimeError("La fusion en un seul PDF nécessite pypdf (pip install pypdf).")
+    compte = {"manquants": 0}
+    exportees = 0
+    volumes = total > PDF_VOLUME
+    writer = PdfWriter()
+    dans_volume = 0
+
+    def write_volume():
+        final = volume_path(path, len(partiels) + 1) if volumes else path
+        partiels.append((final + ".part", final))
+        with open(final + ".part", 'wb') as f:
+            writer.write(f)
+        writer.close()
+
+    for relpath, chemin, contenu in _each(conn, fichiers, total, factures_dir, progress, cancel, compte):
+        writer.append(chemin if contenu is None else io.BytesIO(contenu))
+        exportees += 1
+        dans_volume += 1
+        if dans_volume == PDF_VOLUME:
+            write_volume()
+            writer = PdfWriter()
+            dans_volume = 0
+    if dans_volume or not partiels:
+        write_volume()
+    return exportees, compte["manquants"]
+
+
+def quarter(texte):
+    # "2026-3" ou "2026-T3" -> (1er juillet 2026, 30 septembre 2026 23:59:59)
+    annee, trimestre = (int(v) for v in texte.upper().replace('T', '').split('-'))
+    if not 1 <= trimestre <= 4:
+        raise ValueError(f"trimestre inconnu : {texte}")
+    debut = datetime(annee, 3 * trimestre - 2, 1)
+    fin = datetime(annee + 1, 1, 1) if trimestre == 4 else datetime(annee, 3 * trimestre + 1, 1)
+    return debut, fin - timedelta(seconds=1)
+
+
+def number_range(texte):
+    # "F2026-000100-F2026-000199" -> ("F2026-000100", "F2026-000199") ; un seul
+    # numéro pour une seule facture ; "1000-1999" pour les anciens numéros
+    debut, sep, fin = texte.partition(f"-{numbering.PREFIX}")
+    if sep:
+        fin = numbering.PREFIX + fin
+    elif not texte.startswith(numbering.PREFIX):
+        debut, _, fin = texte.partition('-')
+        if not (debut.isdigit() and (fin or debut).isdigit()):
+            raise ValueError(f"plage de numéros invalide : {texte}")
+        return debut, fin or debut
+    bornes = [numbering.parse_number(numero) for numero in (debut, fin or debut)]
+    return tuple(numbering.format_number(*borne) for borne in bornes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export groupé de factures en ZIP ou en un seul PDF.")
+    parser.add_argument("format", choices=FORMATS)
+    parser.add_argument("output", help="fichier à créer")
+    parser.add_argument("--du", help="date de début incluse (jj/mm/aaaa)")
+    parser.add_argument("--au", help="date de fin incluse (jj/mm/aaaa)")
+    parser.add_argument("--trimestre", help="trimestre, ex. 2026-3")
+    parser.add_argument("--numeros", help="plage de numéros incluse, ex. F2026-000100-F2026-000199")
+    parser.add_argument("--factures", help="dossier de l'archive (défaut : factures/)")
+    args = parser.parse_args(argv)
+
+    filtres = {}
+    try:
+        if args.trimestre:
+            filtres["date_min"], filtres["date_max"] = quarter(args.trimestre)
+        if args.du:
+            filtres["date_min"] = datetime.strptime(args.du, '%d/%m/%Y')
+        if args.au:
+            filtres["date_max"] = datetime.strptime(args.au, '%d/%m/%Y') + timedelta(days=1, seconds=-1)
+    except ValueError as e:
+        parser.error(f"date invalide : {e}")
+    if args.numeros:
+        try:
+            filtres["numero_min"], filtres["numero_max"] = number_range(args.numeros)
+        except ValueError as e:
+            parser.error(str(e))
+
+    def progress(fait, total):
+        print(f"\r  {fait}/{total} facture(s)", end="", file=sys.stderr, flush=True)
+
+    exportees, manquants, ecrits = export(args.output, args.format, filtres, args.factures, progress)
+    print(file=sys.stderr)
+    if manquants:
+        print(f"  {manquants} facture(s) introuvable(s)", file=sys.stderr)
+    print(f"{exportees} facture(s) exportée(s) dans {', '.join(ecrits)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
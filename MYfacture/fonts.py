@@ -0,0 +1,215 @@
+# Polices TrueType Unicode intégrées aux PDF (noms accentués, caractères non
+# latins, vrai signe euro), à la place des polices de base Arial en latin-1.
+#
+# Lire une police TrueType complète (des milliers de glyphes) puis en extraire
+# les caractères utilisés coûte, à chaque facture, bien plus que la facture
+# elle-même. La police est donc réduite une fois aux caractères latins courants
+# (quelques centaines de glyphes, sans les tables de mise en forme avancée que
+# FPDF n'utilise pas) et écrite dans .cache/fonts, partagée par tous les
+# processus ; FPDF ne lit ensuite que ce petit fichier. Avec PyFPDF 1.7, les
+# métriques de la police réduite sont en plus enregistrées à côté (.pkl).
+# Une facture contenant d'autres caractères (grec, cyrillique, CJK...) utilise
+# la police complète. Sans fontTools, la police complète est toujours
+# utilisée ; sans police TrueType trouvée, Arial comme avant.
+#
+# Avec fpdf2, la police est de plus analysée une seule fois par processus
+# (_font_copy) au lieu d'une fois par facture. L'intégration reste plus
+# coûteuse que les polices de base : environ 40 ms par facture d'une ligne
+# contre 5 ms en Arial (PyFPDF 1.7 : environ 17 ms contre 1 ms). L'essentiel
+# est la réduction de la police aux glyphes de la facture et son écriture dans
+# le PDF, faites par FPDF pour chaque document.
+import copy
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+
+import assets
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+CACHE_DIR = os.path.join(assets.CACHE_DIR, 'fonts')
+FAMILY = "MYfacture"
+
+# (normale, grasse) essayées dans l'ordre : dossier fonts/ de l'application, puis le système
+CANDIDATES = [
+    (os.path.join(FONT_DIR, "DejaVuSans.ttf"), os.path.join(FONT_DIR, "DejaVuSans-Bold.ttf")),
+    (r"C:\Windows\Fonts\arial.ttf", r"C:\Windows\Fonts\arialbd.ttf"),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/TTF/DejaVuSans.ttf", "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf"),
+    ("/Library/Fonts/Arial Unicode.ttf", "/Library/Fonts/Arial Unicode.ttf"),
+]
+
+# Caractères conservés dans la police réduite : moins de glyphes, lecture plus rapide
+BASE_RANGES = [
+    (0x20, 0x7E), (0xA0, 0x17F),     # latin de base, latin-1, latin étendu A (œ, ł, š...)
+    (0x2010, 0x2027), (0x2030, 0x203A),  # tirets, guillemets, points de suspension
+    (0x20AC, 0x20AC), (0x2116, 0x2116), (0x2122, 0x2122),  # €, №, ™
+]
+# Tables inutiles pour FPDF : mise en forme avancée, métriques écran
+DROPPED_TABLES = ["GSUB", "GPOS", "GDEF", "kern", "hdmx", "FFTM", "MATH"]
+PICKLE_MAX = 200 * 1024
+BASE_CHARS = frozenset(chr(c) for debut, fin in BASE_RANGES for c in range(debut, fin + 1))
+
+_fontsets = {}
+_parsed = {}
+_uni = None
+_prepare_lock = threading.Lock()
+
+
+def _key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def find_fonts(profil=None):
+    """(police normale, police grasse) à utiliser, ou None. Le profil peut
+    indiquer sa propre police ("Police", "Police grasse")."""
+    profil = profil or {}
+    candidates = list(CANDIDATES)
+    if profil.get("Police"):
+        candidates.insert(0, (profil["Police"], profil.get("Police grasse") or profil["Police"]))
+    for regular, bold in candidates:
+        if os.path.isfile(regular):
+            return regular, bold if os.path.isfile(bold) else regular
+    return None
+
+
+def subset_font(path, chars=BASE_CHARS):
+    """Chemin d'une copie de la police `path` réduite aux caractères `chars`,
+    créée au premier appel dans .cache/fonts (la police d'origine si fontTools
+    n'est pas installé)."""
+    try:
+        from fontTools import subset
+    except ImportError:
+        return path
+
+    key = repr((_key(path), sorted(chars)))
+    cached = os.path.join(CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".ttf")
+    if os.path.exists(cached):
+        return cached
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    options = subset.Options()
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    options.layout_features = []
+    options.hinting = False
+    options.drop_tables += DROPPED_TABLES
+    font = subset.load_font(path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ord(c) for c in chars])
+    subsetter.subset(font)
+    # Écriture atomique : plusieurs processus peuvent préparer la même police
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    subset.save_font(font, tmp, options)
+    os.replace(tmp, cached)
+    return cached
+
+
+class FontSet:
+    """Police normale et grasse d'un profil, avec leurs versions réduites."""
+
+    def __init__(self, regular, bold):
+        self.originals = {"": regular, "B": bold}
+        self.reduced = None
+        self.prepared = False
+
+    def files_for(self, texte):
+        # Police réduite si elle couvre tous les caractères de la facture
+        if not BASE_CHARS.issuperset(texte):
+            return self.originals
+        if self.reduced is None:
+            self.reduced = {style: subset_font(path) for style, path in self.originals.items()}
+        return self.reduced
+
+
+def fontset_for(profil=None):
+    """FontSet du profil, conservé dans le processus ; None sans police TrueType."""
+    fichiers = find_fonts(profil)
+    if fichiers is None:
+        return None
+    fontset = _fontsets.get(fichiers)
+    if fontset is None:
+        fontset = _fontsets[fichiers] = FontSet(*fichiers)
+    return fontset
+
+
+def _uni_argument():
+    # PyFPDF 1.7 demande uni=True pour une police TrueType ; fpdf2 ne l'accepte plus.
+    # fpdf n'est importé qu'ici, au premier rendu : l'interface démarre sans lui.
+    global _uni
+    if _uni is None:
+        from fpdf import FPDF
+        _uni = "uni" in inspect.signature(FPDF.add_font).parameters
+    return _uni
+
+
+def _font_copy(pdf, path, style):
+    # fpdf2 : la police (table des caractères, largeurs, descripteur) est analysée
+    # une fois par processus et par fichier ; chaque document en reçoit une copie
+    # avec sa propre liste des glyphes utilisés et son propre TTFont, que fpdf
+    # réduit en place à l'écriture du PDF. None si fpdf n'a pas cette structure.
+    try:
+        from fontTools import ttLib
+        from fpdf.fonts import SubsetMap, TTFFont
+    except ImportError:
+        return None
+    fontkey = f"{FAMILY.lower()}{style}"
+    key = _key(path) + (style,)
+    modele = _parsed.get(key)
+    if modele is None:
+        try:
+            modele = TTFFont(pdf, path, fontkey, style)
+        except TypeError:
+            return None
+        tables = None
+        if os.path.getsize(path) <= PICKLE_MAX:
+            # Police réduite : tables décodées une fois, recopiées par document
+            try:
+                for tag in modele.ttfont.keys():
+                    modele.ttfont[tag]
+                tables = pickle.dumps(modele.ttfont)
+            except (TypeError, pickle.PicklingError):
+                tables = None
+        if len(_parsed) > 8:
+            _parsed.clear()
+        _parsed[key] = (modele, tables)
+    modele, tables = _parsed[key]
+    font = copy.copy(modele)
+    font.i = len(pdf.fonts) + 1
+    if tables is not None:
+        font.ttfont = pickle.loads(tables)
+    else:
+        font.ttfont = ttLib.TTFont(path, recalcTimestamp=False, lazy=True)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font.subset = SubsetMap(font)
+    return fontkey, font
+
+
+def register(pdf, fontset, texte):
+    """Ajoute la police au document `pdf` et retourne le nom de famille à
+    utiliser avec set_font. `texte` : tous les caractères que la facture écrira."""
+    extra = {"uni": True} if _uni_argument() else {}
+    for style, path in fontset.files_for(texte).items():
+        copie = None if extra else _font_copy(pdf, path, style)
+        if copie is None:
+            pdf.add_font(FAMILY, style, path, **extra)
+        else:
+            fontkey, font = copie
+            pdf.fonts[fontkey] = font
+    return FAMILY
+
+
+def prepare(profil=None):
+    # Avant de lancer des processus de rendu : police réduite prête sur disque
+    # (et, avec PyFPDF 1.7, ses métriques enregistrées à côté) pour tous.
+    # Appelée depuis des threads de l'interface : une seule préparation à la fois
+    with _prepare_lock:
+        fontset = fontset_for(profil)
+        if fontset is None or fontset.prepared:
+            return
+        from fpdf import FPDF
+        register(FPDF(), fontset, "")
+        fontset.prepared = True
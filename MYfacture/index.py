@@ -0,0 +1,258 @@
+# Index SQLite des factures générées (factures/index.sqlite).
+#
+# Chaque facture produite par generate_pdf ou par le traitement par lot y est
+# enregistrée avec son numéro, sa date, son client et ses totaux, ce qui évite
+# à l'onglet Historique de parcourir le dossier des PDF. `fichier` est le
+# chemin relatif dans l'archive (voir archive.py), par exemple
+# "2026/10/facture_20261018_101500.pdf". Le contenu des factures (champs client,
+# lignes) est indexé pour la recherche dans les tables de search.py, et ses
+# montants par taux de TVA cumulés pour les rapports (reports.py). Les
+# factures rangées dans le stockage froid (coldstore.py) n'ont plus de PDF sur
+# disque mais restent dans l'index.
+#
+#   python index.py rebuild    reconstruit l'index d'une archive existante
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import archive
+import coldstore
+import reports
+import search
+
+FACTURES_DIR = archive.FACTURES_DIR
+INDEX_NAME = "index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS factures (
+    fichier TEXT PRIMARY KEY,
+    numero TEXT,
+    date TEXT,
+    client TEXT,
+    total_ht INTEGER,
+    total_ttc INTEGER
+);
+CREATE INDEX IF NOT EXISTS factures_date ON factures (date);
+CREATE INDEX IF NOT EXISTS factures_numero ON factures (numero);
+CREATE INDEX IF NOT EXISTS factures_client ON factures (client COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS factures_total_ht ON factures (total_ht);
+CREATE INDEX IF NOT EXISTS factures_total_ttc ON factures (total_ttc);
+
+-- Dernier état connu de l'archive sur disque, pour les actualisations incrémentales
+CREATE TABLE IF NOT EXISTS fichiers (
+    fichier TEXT PRIMARY KEY,
+    dossier TEXT,
+    taille INTEGER,
+    mtime INTEGER
+);
+CREATE INDEX IF NOT EXISTS fichiers_dossier ON fichiers (dossier);
+CREATE TABLE IF NOT EXISTS dossiers (
+    dossier TEXT PRIMARY KEY,
+    mtime INTEGER
+);
+"""
+
+# Colonnes de l'onglet Historique -> colonnes triables de l'index
+SORT_COLUMNS = {
+    "Date": "date",
+    "Numéro": "numero",
+    "Client": "client COLLATE NOCASE",
+    "Total HT": "total_ht",
+    "Total TTC": "total_ttc",
+}
+
+
+def connect(factures_dir=None):
+    factures_dir = factures_dir or FACTURES_DIR
+    os.makedirs(factures_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(factures_dir, INDEX_NAME), timeout=30)
+    conn.executescript(SCHEMA + search.SCHEMA + reports.SCHEMA + coldstore.SCHEMA)
+    return conn
+
+
+def _iso(date):
+    return date.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def record_invoice(conn, fichier, numero, date, client, totaux, client_fields=None, lignes=None):
+    # `totaux` en centimes (totals.Totaux) ; `date` un datetime. Avec `client_fields`
+    # et `lignes` (produit, prix, quantité, tva, remise), le contenu est indexé pour la
+    # recherche et ajouté aux cumuls des rapports.
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO factures (fichier, numero, date, client, total_ht, total_ttc) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (fichier, numero, _iso(date), client, totaux.ht, totaux.ttc),
+        )
+        if client_fields is not None:
+            search.record_content(conn, fichier, client_fields, lignes or [])
+            reports.record(conn, fichier, date, client, lignes or [])
+
+
+def has_invoice(conn, fichier):
+    # Facture connue de l'index, sur disque ou dans le stockage froid
+    return conn.execute("SELECT 1 FROM factures WHERE fichier = ?", (fichier,)).fetchone() is not None
+
+
+def _forget(conn, fichier):
+    conn.execute("DELETE FROM factures WHERE fichier = ?", (fichier,))
+    search.delete_content(conn, fichier)
+    reports.forget(conn, fichier)
+
+
+def _where(filtres):
+    # filtres : {"client": texte, "date_min": datetime, "date_max": datetime,
+    #            "numero_min": texte, "numero_max": texte,
+    #            "recherche": critères de search.parse_query}
+    clauses, params = [], []
+    filtres = filtres or {}
+    if filtres.get("client"):
+        clauses.append("client LIKE ?")
+        params.append(f"%{filtres['client']}%")
+    if filtres.get("date_min"):
+        clauses.append("date >= ?")
+        params.append(_iso(filtres["date_min"]))
+    if filtres.get("date_max"):
+        clauses.append("date <= ?")
+        params.append(_iso(filtres["date_max"]))
+    for cle, operateur in (("numero_min", ">="), ("numero_max", "<=")):
+        numero = filtres.get(cle)
+        if numero:
+            # Numéros entièrement numériques comparés comme des nombres ("9" < "10")
+            if numero.isdigit():
+                clauses.append(f"CAST(numero AS INTEGER) {operateur} ?")
+                params.append(int(numero))
+            else:
+                clauses.append(f"numero {operateur} ?")
+                params.append(numero)
+    if filtres.get("recherche"):
+        recherche, recherche_params = search.where_clauses(filtres["recherche"])
+        clauses.extend(recherche)
+        params.extend(recherche_params)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def count_invoices(conn, filtres=None):
+    where, params = _where(filtres)
+    return conn.execute("SELECT COUNT(*) FROM factures" + where, params).fetchone()[0]
+
+
+def page_invoices(conn, filtres=None, tri="Date", descendant=True, offset=0, limit=50):
+    """Une fenêtre de `limit` factures à partir de `offset`, triées et filtrées par SQLite."""
+    where, params = _where(filtres)
+    ordre = "DESC" if descendant else "ASC"
+    # Le nom de fichier départage les égalités pour une pagination stable
+    sql = (
+        "SELECT fichier, numero, date, client, total_ht, total_ttc FROM factures" + where +
+        f" ORDER BY {SORT_COLUMNS[tri]} {ordre}, fichier {ordre} LIMIT ? OFFSET ?"
+    )
+    return conn.execute(sql, params + [limit, offset]).fetchall()
+
+
+def iter_invoices(conn, filtres=None, tri="Date", descendant=False):
+    """Toutes les factures filtrées, lues au fil d'un curseur SQLite : la
+    mémoire utilisée ne dépend pas du nombre de factures."""
+    where, params = _where(filtres)
+    ordre = "DESC" if descendant else "ASC"
+    yield from conn.execute(
+        "SELECT fichier, numero, date, client, total_ht, total_ttc FROM factures" + where +
+        f" ORDER BY {SORT_COLUMNS[tri]} {ordre}, fichier {ordre}", params)
+
+
+def _indexed_in(conn, reldir):
+    # Factures de l'index rangées directement dans `reldir`
+    if not reldir:
+        return [row[0] for row in conn.execute("SELECT fichier FROM factures WHERE fichier NOT LIKE '%/%'")]
+    # "/" + 1 = "0" : intervalle sur la clé primaire, sans parcours de table
+    return [row[0] for row in conn.execute(
+        "SELECT fichier FROM factures WHERE fichier >= ? AND fichier < ?", (f"{reldir}/", f"{reldir}0"))
+        if '/' not in row[0][len(reldir) + 1:]]
+
+
+def _sync_dir(conn, reldir, path, changes):
+    connus = {row[0]: (row[1], row[2]) for row in conn.execute(
+        "SELECT fichier, taille, mtime FROM fichiers WHERE dossier = ?", (reldir,))}
+    indexes = set(_indexed_in(conn, reldir))
+    presents = {}
+    for relpath, entry in archive.list_pdfs(reldir, path):
+        st = entry.stat()
+        presents[relpath] = (st.st_size, st.st_mtime_ns, st.st_ctime)
+
+    for relpath, (taille, mtime, ctime) in presents.items():
+        if relpath not in connus:
+            conn.execute("INSERT OR REPLACE INTO fichiers VALUES (?, ?, ?, ?)", (relpath, reldir, taille, mtime))
+            if relpath not in indexes:
+                # Facture déposée par un autre moyen : ni client ni totaux connus
+                conn.execute("INSERT INTO factures (fichier, numero, date) VALUES (?, ?, ?)",
+                             (relpath, os.path.basename(relpath)[:-4], _iso(datetime.fromtimestamp(ctime))))
+            changes["ajouts"].append(relpath)
+        elif connus[relpath] != (taille, mtime):
+            conn.execute("UPDATE fichiers SET taille = ?, mtime = ? WHERE fichier = ?", (taille, mtime, relpath))
+            changes["modifications"].append(relpath)
+
+    # Les factures du stockage froid n'ont plus de PDF dans le dossier
+    for relpath in (connus.keys() | indexes) - presents.keys() - coldstore.cold_in(conn, reldir):
+        conn.execute("DELETE FROM fichiers WHERE fichier = ?", (relpath,))
+        _forget(conn, relpath)
+        changes["suppressions"].append(relpath)
+
+
+def sync(conn, factures_dir=None, full=False):
+    """Applique à l'index les ajouts, suppressions et modifications de PDF
+    depuis la dernière synchronisation.
+
+    Seuls les dossiers dont la date de modification a changé sont relus : le
+    coût suit le nombre de dossiers modifiés, pas la taille de l'archive.
+    `full` relit tous les dossiers (réécriture d'un PDF sur place, qui ne
+    change pas la date du dossier). Retourne les chemins changés par type.
+    """
+    factures_dir = factures_dir or FACTURES_DIR
+    changes = {"ajouts": [], "suppressions": [], "modifications": []}
+    dossiers = dict(conn.execute("SELECT dossier, mtime FROM dossiers"))
+    vus = set()
+    with conn:
+        for reldir, path in archive.iter_shards(factures_dir):
+            vus.add(reldir)
+            # Date lue avant le parcours : un ajout pendant celui-ci sera vu la fois suivante
+            mtime = os.stat(path).st_mtime_ns
+            if not full and dossiers.get(reldir) == mtime:
+                continue
+            _sync_dir(conn, reldir, path, changes)
+            conn.execute("INSERT OR REPLACE INTO dossiers VALUES (?, ?)", (reldir, mtime))
+        for reldir in dossiers.keys() - vus:
+            # Dossier disparu : toutes ses factures aussi
+            for relpath in (set(_indexed_in(conn, reldir)) | {row[0] for row in conn.execute(
+                    "SELECT fichier FROM fichiers WHERE dossier = ?", (reldir,))}) - coldstore.cold_in(conn, reldir):
+                _forget(conn, relpath)
+                changes["suppressions"].append(relpath)
+            conn.execute("DELETE FROM fichiers WHERE dossier = ?", (reldir,))
+            conn.execute("DELETE FROM dossiers WHERE dossier = ?", (reldir,))
+    return changes
+
+
+def rebuild(factures_dir=None):
+    """Met l'index en accord avec l'archive : ajoute les PDF inconnus et retire
+    les entrées dont le fichier a disparu. Les montants déjà connus sont conservés ;
+    les factures antérieures à l'index n'ont ni client ni totaux. Les factures
+    du stockage froid sont rechargées depuis son manifeste."""
+    conn = connect(factures_dir)
+    # Avant la synchronisation : leur PDF n'est plus sur disque
+    restaurees = coldstore.restore(conn, factures_dir)
+    changes = sync(conn, factures_dir, full=True)
+    conn.close()
+    return len(changes["ajouts"]) + restaurees, len(changes["suppressions"])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["rebuild"]:
+        print("usage : python index.py rebuild [dossier_factures]", file=sys.stderr)
+        return 2
+    ajoutes, retires = rebuild(argv[1] if len(argv) > 1 else None)
+    print(f"Index reconstruit : {ajoutes} facture(s) ajoutée(s), {retires} retirée(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# Stockage compact des lignes d'une facture, source de vérité du formulaire.
+#
+# Chaque colonne est un tableau typé (array) : quelques octets par ligne au
+# lieu d'une ligne de Treeview et de chaînes formatées. Les totaux et le rendu
+# PDF lisent directement ces colonnes ; le Treeview n'en affiche qu'une fenêtre.
+from array import array
+from bisect import bisect_left
+
+import totals
+
+
+class LineStore:
+    """Lignes de produits en colonnes typées, avec totaux cumulés.
+
+    Chaque ligne reçoit un identifiant croissant, stable après suppression
+    d'autres lignes : la position d'une ligne se retrouve par dichotomie.
+    """
+
+    __slots__ = ("ids", "produits", "prix", "quantites", "tvas", "remises",
+                 "ht", "montants_remise", "montants_tva", "net", "next_id", "running")
+
+    def __init__(self):
+        self.ids = array('q')
+        self.produits = []
+        self.prix = array('d')
+        self.quantites = array('q')
+        self.tvas = array('d')
+        self.remises = array('d')
+        # Montants calculés de chaque ligne, en centimes
+        self.ht = array('q')
+        self.montants_remise = array('q')
+        self.montants_tva = array('q')
+        self.net = array('q')
+        self.next_id = 0
+        self.running = totals.RunningTotals()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _columns(self):
+        return (self.ids, self.produits, self.prix, self.quantites, self.tvas, self.remises,
+                self.ht, self.montants_remise, self.montants_tva, self.net)
+
+    def append(self, produit, prix, quantite, tva, remise=0):
+        ligne = totals.compute_line(prix, quantite, tva, remise)
+        line_id = self.next_id
+        self.next_id += 1
+        valeurs = (line_id, produit, prix, quantite, tva, remise,
+                   ligne.ht, ligne.remise, ligne.tva, ligne.net)
+        for colonne, valeur in zip(self._columns(), valeurs):
+            colonne.append(valeur)
+        self.running.add(ligne)
+        return line_id
+
+    def position(self, line_id):
+        pos = bisect_left(self.ids, line_id)
+        if pos == len(self.ids) or self.ids[pos] != line_id:
+            raise KeyError(line_id)
+        return pos
+
+    def remove(self, line_id):
+        pos = self.position(line_id)
+        ligne = totals.Ligne(self.ht[pos], self.montants_remise[pos], self.net[pos], self.montants_tva[pos],
+                             self.net[pos] + self.montants_tva[pos])
+        for colonne in self._columns():
+            del colonne[pos]
+        self.running.remove(ligne)
+        return ligne
+
+    def clear(self):
+        for colonne in self._columns():
+            del colonne[:]
+        self.running.reset()
+
+    def row(self, pos):
+        # (id, produit, prix, quantité, tva, remise, net en centimes)
+        return (self.ids[pos], self.produits[pos], self.prix[pos], self.quantites[pos],
+                self.tvas[pos], self.remises[pos], self.net[pos])
+
+    def rows(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        return [self.row(pos) for pos in range(start, stop)]
+
+    def items(self):
+        # (produit, prix, quantité, tva, remise) de chaque ligne, dans l'ordre
+        return list(zip(self.produits, self.prix, self.quantites, self.tvas, self.remises))
+
+    def totals(self):
+        return self.running.totals()
+
+    def recompute(self):
+        # Recalcul complet depuis les colonnes, sans passer par le Treeview
+        return totals.compute_totals(self.prix, self.quantites, self.tvas, self.remises)
+
+    def snapshot(self):
+        # Copie indépendante (copie de tableaux en C), par exemple pour un rendu en arrière-plan
+        copie = LineStore()
+        for name in self.__slots__:
+            valeur = getattr(self, name)
+            if isinstance(valeur, (array, list)):
+                valeur = valeur[:]
+            setattr(copie, name, valeur)
+        copie.running = totals.RunningTotals()
+        copie.running.reset(self.totals())
+        return copie
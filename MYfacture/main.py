@@ -1,15 +1,42 @@
+import time
+import os
+import sys
+
+# Mode mesure du démarrage : MYFACTURE_STARTUP_TIMING=1 ou --startup-timing
+STARTUP_TIMING = bool(os.environ.get("MYFACTURE_STARTUP_TIMING")) or "--startup-timing" in sys.argv
+_startup_marks = [("début", time.perf_counter())]
+
 import customtkinter as ctk
 import tkinter as tk # Keep tkinter for some specific functionalities if needed, but we'll primarily use ctk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 import json
-import os
-from fpdf import FPDF
-import webbrowser
-import time
+import queue
+import threading
+import totals
+import assets
+import catalog
+import coldstore
+import drafts
+import fonts
+import archive
+import index
+import lines
+import numbering
+import reports
+import search
+import timing
+# fpdf (via render), PIL et webbrowser ne sont importés qu'au premier usage
+
+_startup_marks.append(("imports", time.perf_counter()))
 
 # Change FacturationApp to inherit from ctk.CTk
 class FacturationApp(ctk.CTk):
     PROFILE_FILE = "profil_entreprise.json"
+    DRAFT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brouillon.jsonl")
+    PDF_WORKERS = 2
+    PDF_POLL_MS = 100
+    SUGGEST_DELAY_MS = 120  # pause de frappe avant de chercher dans le catalogue
+    SUGGEST_POLL_MS = 20
 
     def __init__(self):
         super().__init__()
@@ -59,7 +86,7 @@ class FacturationApp(ctk.CTk):
 
         # Notebook with tabs - CustomTkinter does not have a direct CTkNotebook equivalent.
         # We will simulate it using CTkSegmentedButton and CTkFrames.
-        self.tab_names = ["Profil Société", "Nouvelle Facture", "Historique"]
+        self.tab_names = ["Profil Société", "Nouvelle Facture", "Historique", "Rapports"]
         self.tab_frames = {}
 
         self.segmented_button = ctk.CTkSegmentedButton(main_frame, values=self.tab_names,
@@ -81,6 +108,15 @@ class FacturationApp(ctk.CTk):
             frame.pack(fill='both', expand=True, padx=10, pady=10)
             self.tab_frames[tab_name] = frame
 
+        # Le contenu de chaque onglet est construit à sa première sélection
+        self.tab_builders = {
+            "Profil Société": self.create_profil_form,
+            "Nouvelle Facture": self.create_facture_form,
+            "Historique": self.create_historique_view,
+            "Rapports": self.create_rapports_view,
+        }
+        self.built_tabs = set()
+
         # Initial tab display
         self.segmented_button.set(self.tab_names[0])
         self.change_tab(self.tab_names[0])
@@ -94,49 +130,40 @@ class FacturationApp(ctk.CTk):
                                 text_color=self.colors["text"])
         footer_label.pack(side='right')
 
-        # Call the form creation methods, passing the correct frame
-        self.create_profil_form(self.tab_frames["Profil Société"])
-        self.create_facture_form(self.tab_frames["Nouvelle Facture"])
-        self.create_historique_view(self.tab_frames["Historique"])
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.mark_startup("fenêtre")
+        if STARTUP_TIMING:
+            self.after_idle(self.report_startup)
 
     def change_tab(self, selected_tab):
+        if selected_tab not in self.built_tabs:
+            self.built_tabs.add(selected_tab)
+            self.tab_builders[selected_tab](self.tab_frames[selected_tab])
+            self.mark_startup(f"onglet {selected_tab}")
         # Hide all tab frames
         for tab_name in self.tab_names:
             self.tab_frames[tab_name].pack_forget()
         # Show the selected tab frame
         self.tab_frames[selected_tab].pack(fill='both', expand=True)
 
-    # Modify create_profil_form to accept a frame argument
-    def create_profil_form(self, parent_frame):
-        frame = parent_frame
-        
-        # Titre de la section
-        title_label = ctk.CTkLabel(frame, text="Informations de votre entreprise", 
-                               font=ctk.CTkFont(size=16, weight="bold"), 
-                               text_color=self.colors["primary"])
-        title_label.grid(row=0, column=0, columnspan=3, sticky='w', padx=10, pady=(0, 20))
-
-        labels = ["Nom de la société", "Adresse", "Téléphone", "E-mail", "Numéro SIRET", "Logo"]
-        self.entries = {}
-
-        # Créer un cadre pour les champs de formulaire
-        form_frame = ctk.CTkFrame(frame, fg_color="transparent") # Transparent background for form frame
-        form_frame.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
-
-        for i, label_text in enumerate(labels[:-1]):
-            label = ctk.CTkLabel(form_frame, text=label_text, font=ctk.CTkFont(size=10))
-            label.grid(row=i, column=0, sticky='w', padx=10, pady=10)
-            
-            entry = ctk.CTkEntry(form_frame, width=300) # Use CTkEntry
-            entry.grid(row=i, column=1, padx=10, pady=10)
-            self.entries[label_text] = entry
+    def mark_startup(self, label):
+        if STARTUP_TIMING:
+            _startup_marks.append((label, time.perf_counter()))
 
-    # You will need to modify create_facture_form and create_historique_view similarly
-    # to accept a parent_frame argument and use ctk widgets.
-    # I will provide those modifications in the next steps.
+    def report_startup(self):
+        # Affiché une fois la fenêtre dessinée : durée de chaque étape depuis la précédente
+        self.update_idletasks()
+        self.mark_startup("affichage")
+        debut = _startup_marks[0][1]
+        precedent = debut
+        for label, instant in _startup_marks[1:]:
+            print(f"{label:<28} {(instant - precedent) * 1000:8.1f} ms  (cumul {(instant - debut) * 1000:8.1f} ms)",
+                  file=sys.stderr)
+            precedent = instant
 
-    def create_profil_form(self):
-        frame = self.profil_frame
+    def create_profil_form(self, parent_frame):
+        frame = parent_frame
         
         # Titre de la section
         title_label = ttk.Label(frame, text="Informations de votre entreprise", 
@@ -202,11 +229,10 @@ class FacturationApp(ctk.CTk):
             
             # Prévisualisation du logo
             try:
-                from PIL import Image, ImageTk
+                from PIL import ImageTk
                 
-                # Ouvrir et redimensionner l'image
-                img = Image.open(file_path)
-                img = img.resize((150, 150), Image.LANCZOS)
+                # Image redimensionnée, mise en cache par chemin et date de modification
+                img = assets.logo_preview(file_path)
                 photo = ImageTk.PhotoImage(img)
                 
                 # Mettre à jour la prévisualisation
@@ -223,6 +249,7 @@ class FacturationApp(ctk.CTk):
         try:
             with open(self.PROFILE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
+            assets.invalidate(self.PROFILE_FILE)
             messagebox.showinfo("Succès", "Profil sauvegardé avec succès.")
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la sauvegarde : {e}")
@@ -239,8 +266,8 @@ class FacturationApp(ctk.CTk):
             except Exception as e:
                 messagebox.showerror("Erreur", f"Erreur lors du chargement du profil : {e}")
 
-    def create_facture_form(self):
-        frame = self.facture_frame
+    def create_facture_form(self, parent_frame):
+        frame = parent_frame
         
         # Titre de la section
         title_label = ttk.Label(frame, text="Création d'une nouvelle facture", 
@@ -288,10 +315,13 @@ class FacturationApp(ctk.CTk):
         
         self.tree.grid(row=1, column=0, columnspan=6, padx=5, pady=5, sticky='nsew')
         
-        # Scrollbar pour le tableau
-        scrollbar = ttk.Scrollbar(products_frame, orient="vertical", command=self.tree.yview)
-        scrollbar.grid(row=1, column=6, sticky='ns')
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Scrollbar pour le tableau : le Treeview n'affiche qu'une fenêtre des lignes
+        self.lines_scrollbar = ttk.Scrollbar(products_frame, orient="vertical", command=self.scroll_lines)
+        self.lines_scrollbar.grid(row=1, column=6, sticky='ns')
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_lines("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_lines("scroll", -1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_lines("scroll", 1, "units"))
+        self.tree.bind("<Configure>", self.resize_lines)
         
         # Champs pour ajouter un produit
         entry_frame = ttk.Frame(products_frame)
@@ -307,6 +337,26 @@ class FacturationApp(ctk.CTk):
             entry = ttk.Entry(entry_frame, textvariable=var, width=width)
             entry.grid(row=1, column=i, padx=5, pady=5)
             self.entry_vars[label_text] = var
+            if label_text == "Produit":
+                self.product_entry = entry
+
+        # Suggestions du catalogue sous le champ Produit
+        self.catalog = None
+        self.catalog_queue = queue.Queue()
+        self.catalog_pending = 0
+        self.search_requests = queue.Queue()
+        self.search_thread = None
+        self.suggest_job = None
+        self.suggestions = []
+        self.suggestion_list = tk.Listbox(self, height=8, width=70, activestyle='dotbox')
+        self.product_entry.bind("<KeyRelease>", self.suggest_products)
+        self.product_entry.bind("<Down>", self.focus_suggestions)
+        self.product_entry.bind("<Escape>", lambda event: self.hide_suggestions())
+        self.product_entry.bind("<FocusOut>", lambda event: self.after(150, self.hide_suggestions_if_unfocused))
+        self.suggestion_list.bind("<Return>", lambda event: self.apply_suggestion())
+        self.suggestion_list.bind("<Double-1>", lambda event: self.apply_suggestion())
+        self.suggestion_list.bind("<Escape>", lambda event: self.hide_suggestions())
+        self.load_catalog()
         
         # Boutons d'action pour les produits
         button_frame = ttk.Frame(products_frame)
@@ -317,6 +367,9 @@ class FacturationApp(ctk.CTk):
         
         delete_button = ttk.Button(button_frame, text="Supprimer ligne", command=self.delete_product_line)
         delete_button.pack(side='left', padx=5)
+
+        catalog_button = ttk.Button(button_frame, text="Importer un catalogue...", command=self.import_catalog)
+        catalog_button.pack(side='left', padx=5)
         
         # Section totaux
         totals_frame = ttk.Frame(frame, padding=10)
@@ -326,6 +379,21 @@ class FacturationApp(ctk.CTk):
         self.total_tva_var = tk.StringVar(value="0.00")
         self.total_remise_var = tk.StringVar(value="0.00")
         self.total_ttc_var = tk.StringVar(value="0.00")
+
+        # Lignes de la facture en colonnes typées ; les totaux y sont tenus à jour
+        # par différence à chaque ajout/suppression de ligne
+        self.lines = lines.LineStore()
+        self.lines_offset = 0
+        self.lines_page_size = 6
+
+        # Brouillon de la saisie précédente rejoué depuis son journal, puis
+        # chaque modification y est ajoutée (voir drafts.py)
+        self.draft = drafts.DraftJournal(self.DRAFT_FILE, self.lines)
+        for champ, valeur in self.draft.load().items():
+            if champ in self.client_vars:
+                self.client_vars[champ].set(valeur)
+        for champ, var in self.client_vars.items():
+            var.trace_add('write', lambda *args, champ=champ, var=var: self.draft.client_changed(champ, var.get()))
         
         # Style pour les labels de totaux
         total_label_style = {"font": ("Segoe UI", 10), "padding": 5}
@@ -347,111 +415,342 @@ class FacturationApp(ctk.CTk):
         action_frame = ttk.Frame(frame)
         action_frame.grid(row=4, column=0, columnspan=6, sticky='e', padx=10, pady=20)
         
+        check_button = ttk.Button(action_frame, text="Vérifier les totaux", command=self.update_totals)
+        check_button.pack(side='left', padx=5)
+
+        new_button = ttk.Button(action_frame, text="Nouvelle facture", command=self.new_invoice)
+        new_button.pack(side='left', padx=5)
+
         pdf_button = ttk.Button(action_frame, text="Générer PDF", command=self.generate_pdf)
-        pdf_button.pack()
+        pdf_button.pack(side='left', padx=5)
+
+        # Suivi des générations en arrière-plan
+        self.pdf_status_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.pdf_status_var).grid(row=5, column=0, columnspan=6, sticky='e', padx=10)
+        self.pdf_executor = None
+        self.pdf_queue = queue.Queue()
+        self.pdf_pending = 0
         
         # Configurer l'expansion des lignes et colonnes
         frame.columnconfigure(0, weight=1)
         frame.rowconfigure(2, weight=1)
 
+        if len(self.lines):
+            self.show_lines_window(len(self.lines))
+            self.show_totals(self.lines.totals())
+
+    def load_catalog(self):
+        # Chargement et index approché construits hors de la boucle Tk ; le
+        # catalogue, ou le message d'erreur, est remis par catalog_queue
+        def worker():
+            try:
+                produits = catalog.Catalog()
+                produits.build_trigrams()
+            except Exception as e:
+                self.catalog_queue.put(("erreur", str(e)))
+                return
+            self.catalog_queue.put(("catalogue", produits))
+        threading.Thread(target=worker, daemon=True).start()
+        self.catalog_pending += 1
+        if self.catalog_pending == 1:
+            self.after(self.SUGGEST_POLL_MS, self.poll_catalog_queue)
+
+    def poll_catalog_queue(self):
+        # Appelé dans la boucle Tk : met en place le catalogue chargé et affiche
+        # les suggestions calculées par search_worker
+        while not self.catalog_queue.empty():
+            genre, valeur = self.catalog_queue.get_nowait()
+            if genre == "suggestions":
+                texte, resultats, traitees = valeur
+                self.catalog_pending -= traitees
+                self.show_suggestions(texte, resultats)
+                continue
+            self.catalog_pending -= 1
+            if genre == "erreur":
+                # La saisie reste possible, sans suggestions
+                messagebox.showerror("Erreur", f"Erreur lors du chargement du catalogue : {valeur}")
+            else:
+                self.catalog = valeur
+        if self.catalog_pending:
+            self.after(self.SUGGEST_POLL_MS, self.poll_catalog_queue)
+
+    def search_worker(self):
+        # Thread de recherche : les saisies arrivées entre-temps sont regroupées,
+        # seule la plus récente est cherchée
+        while True:
+            produits, texte = self.search_requests.get()
+            traitees = 1
+            while not self.search_requests.empty():
+                produits, texte = self.search_requests.get_nowait()
+                traitees += 1
+            try:
+                with timing.span("catalogue.recherche"):
+                    resultats = produits.search(texte)
+            except Exception:
+                resultats = []
+            self.catalog_queue.put(("suggestions", (texte, resultats, traitees)))
+
+    def import_catalog(self):
+        file_path = filedialog.askopenfilename(title="Importer un catalogue", filetypes=[("CSV", "*.csv")])
+        if not file_path:
+            return
+        try:
+            total = catalog.import_csv(file_path)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'import du catalogue : {e}")
+            return
+        self.load_catalog()
+        messagebox.showinfo("Succès", f"{total} produit(s) importé(s) dans le catalogue.")
+
+    def suggest_products(self, event=None):
+        if event is not None and event.keysym in ("Down", "Up", "Escape", "Return", "Tab"):
+            return
+        # Recherche lancée après une courte pause de frappe, hors de la boucle Tk
+        if self.suggest_job is not None:
+            self.after_cancel(self.suggest_job)
+        self.suggest_job = self.after(self.SUGGEST_DELAY_MS, self.request_suggestions)
+
+    def request_suggestions(self):
+        self.suggest_job = None
+        if self.catalog is None:
+            return
+        if self.search_thread is None:
+            self.search_thread = threading.Thread(target=self.search_worker, daemon=True)
+            self.search_thread.start()
+        self.search_requests.put((self.catalog, self.entry_vars["Produit"].get()))
+        self.catalog_pending += 1
+        if self.catalog_pending == 1:
+            self.after(self.SUGGEST_POLL_MS, self.poll_catalog_queue)
+
+    def show_suggestions(self, texte, resultats):
+        if texte != self.entry_vars["Produit"].get():
+            # Saisie modifiée depuis : une recherche plus récente suit
+            return
+        self.suggestions = resultats
+        if not self.suggestions:
+            self.hide_suggestions()
+            return
+        self.suggestion_list.delete(0, tk.END)
+        for reference, libelle, prix, tva in self.suggestions:
+            self.suggestion_list.insert(tk.END, f"{reference} — {libelle} — {prix:.2f} HT — TVA {tva:g} %")
+        self.suggestion_list.place(in_=self.product_entry, x=0, rely=1.0)
+        self.suggestion_list.lift()
+
+    def focus_suggestions(self, event=None):
+        if self.suggestions and self.suggestion_list.winfo_ismapped():
+            self.suggestion_list.focus_set()
+            self.suggestion_list.selection_clear(0, tk.END)
+            self.suggestion_list.selection_set(0)
+            self.suggestion_list.activate(0)
+
+    def apply_suggestion(self):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        reference, libelle, prix, tva = self.suggestions[selection[0]]
+        self.entry_vars["Produit"].set(libelle)
+        self.entry_vars["Prix Unitaire HT"].set(f"{prix:.2f}")
+        self.entry_vars["TVA (%)"].set(f"{tva:g}")
+        self.hide_suggestions()
+        self.product_entry.focus_set()
+
+    def hide_suggestions(self):
+        if self.suggest_job is not None:
+            self.after_cancel(self.suggest_job)
+            self.suggest_job = None
+        self.suggestion_list.place_forget()
+
+    def hide_suggestions_if_unfocused(self):
+        if self.focus_get() is not self.suggestion_list:
+            self.hide_suggestions()
+
     def delete_product_line(self):
         selected_item = self.tree.selection()
         if not selected_item:
             messagebox.showwarning("Attention", "Veuillez sélectionner une ligne à supprimer.")
             return
-        for item in selected_item:
-            self.tree.delete(item)
-        self.update_totals()
+        line_ids = [int(item) for item in selected_item]
+        for line_id in line_ids:
+            self.lines.remove(line_id)
+        self.draft.removed(line_ids)
+        self.show_lines_window(self.lines_offset)
+        self.show_totals(self.lines.totals())
+
+    def show_lines_window(self, offset):
+        offset = max(0, min(offset, len(self.lines) - self.lines_page_size))
+        self.lines_offset = offset
+        selection = set(self.tree.selection())
+
+        self.tree.delete(*self.tree.get_children())
+        for line_id, produit, prix_ht, quantite, tva, remise, net in self.lines.rows(offset, offset + self.lines_page_size):
+            self.tree.insert('', 'end', iid=str(line_id), values=(produit, f"{prix_ht:.2f}", quantite, f"{tva:.2f}", f"{remise:.2f}", totals.format_cents(net)))
+        self.tree.selection_set([item for item in selection if self.tree.exists(item)])
+
+        count = len(self.lines)
+        if count:
+            self.lines_scrollbar.set(offset / count, min(1.0, (offset + self.lines_page_size) / count))
+        else:
+            self.lines_scrollbar.set(0, 1)
+
+    def scroll_lines(self, action, value, unit=None):
+        if action == "moveto":
+            offset = int(float(value) * len(self.lines))
+        elif unit == "pages":
+            offset = self.lines_offset + int(value) * self.lines_page_size
+        else:
+            offset = self.lines_offset + int(value)
+        self.show_lines_window(offset)
+
+    def resize_lines(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        page_size = max(1, (event.height - 25) // row_height)
+        if page_size != self.lines_page_size:
+            self.lines_page_size = page_size
+            self.show_lines_window(self.lines_offset)
 
     def generate_pdf(self):
         from datetime import datetime
-        profil = {}
-        if os.path.exists(self.PROFILE_FILE):
-            with open(self.PROFILE_FILE, 'r', encoding='utf-8') as f:
-                profil = json.load(f)
+        with timing.span("generate_pdf.profil"):
+            profil = assets.load_profile(self.PROFILE_FILE)
+
+        import render
+
+        # Numéro suivant de la série de l'année, réservé dès maintenant
+        date = datetime.now()
+        with numbering.Allocator() as allocator:
+            numero = allocator.next(date)
 
-        factures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'factures')
-        if not os.path.exists(factures_dir):
-            os.makedirs(factures_dir)
-            
         # Demander le nom du fichier PDF
-        default_filename = f"facture_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        custom_filename = tk.simpledialog.askstring(
-            "Nom du fichier", 
-            "Entrez un nom pour votre facture (sans l'extension .pdf) :",
-            initialvalue=default_filename
-        )
-        
-        # Si l'utilisateur annule, utiliser le nom par défaut
-        if custom_filename is None or custom_filename.strip() == "":
-            custom_filename = default_filename
-        
-        # Nettoyer le nom de fichier pour éviter les caractères invalides
-        import re
-        custom_filename = re.sub(r'[\\/*?:"<>|]', "_", custom_filename)
-        
-        # Chemin complet du fichier
-        filename = os.path.join(factures_dir, f"{custom_filename}.pdf")
+        default_filename = f"facture_{numero}"
+        while True:
+            custom_filename = tk.simpledialog.askstring(
+                "Nom du fichier", 
+                "Entrez un nom pour votre facture (sans l'extension .pdf) :",
+                initialvalue=default_filename
+            )
 
-        pdf = FPDF()
-        pdf.add_page()
+            # Si l'utilisateur annule, utiliser le nom par défaut
+            if custom_filename is None or custom_filename.strip() == "":
+                custom_filename = default_filename
 
-        pdf.set_font('Arial', 'B', 16)
+            custom_filename = render.clean_filename(custom_filename)
 
-        logo_path = profil.get("Logo", "")
-        if logo_path and os.path.exists(logo_path):
-            pdf.image(logo_path, 10, 8, 33)
+            # Chemin complet du fichier, dans le dossier année/mois de l'archive
+            relpath = archive.relative_path(f"{custom_filename}.pdf", date)
+            filename = archive.invoice_path(f"{custom_filename}.pdf", date)
+            # Fichier réservé par une création exclusive (comme batch.render_record) :
+            # une autre facture, sur disque ou dans le stockage froid, n'est jamais écrasée
+            conn = index.connect()
+            try:
+                if not index.has_invoice(conn, relpath):
+                    os.close(os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    break
+            except FileExistsError:
+                pass
+            finally:
+                conn.close()
+            if custom_filename == default_filename:
+                with numbering.Allocator() as allocator:
+                    allocator.release(numero)
+                messagebox.showerror("Erreur", f"La facture {relpath} existe déjà.")
+                return
+            messagebox.showerror("Nom déjà utilisé", f"La facture {relpath} existe déjà. Choisissez un autre nom.")
 
-        pdf.cell(0, 10, profil.get("Nom de la société", ""), ln=True, align='C')
-        pdf.set_font('Arial', '', 12)
-        pdf.cell(0, 10, profil.get("Adresse", ""), ln=True, align='C')
-        pdf.cell(0, 10, f"Téléphone: {profil.get('Téléphone', '')} - E-mail: {profil.get('E-mail', '')}", ln=True, align='C')
-        pdf.cell(0, 10, f"SIRET: {profil.get('Numéro SIRET', '')}", ln=True, align='C')
+        client = {key: var.get() for key, var in self.client_vars.items()}
+        with timing.span("generate_pdf.lignes"):
+            # Copie des colonnes : la saisie peut continuer pendant le rendu
+            lignes = self.lines.snapshot()
 
-        pdf.ln(10)
+        # Rendu dans un processus de travail : la fenêtre reste utilisable et
+        # plusieurs factures peuvent être générées en parallèle.
+        if self.pdf_executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pdf_executor = ProcessPoolExecutor(max_workers=self.PDF_WORKERS)
+        # Modifications du brouillon à la soumission : s'il n'a pas changé pendant le rendu, il est vidé ensuite
+        infos = (filename, relpath, numero, date, client, lignes.items(), self.draft.edits)
 
-        # Add client information section
-        pdf.set_font('Arial', 'B', 14)
-        pdf.cell(0, 10, "Informations Client", ln=True)
-        pdf.set_font('Arial', '', 12)
-        pdf.cell(0, 8, f"Nom: {self.client_vars.get('Nom du client').get()}", ln=True)
-        pdf.cell(0, 8, f"Adresse: {self.client_vars.get('Adresse client').get()}", ln=True)
-        pdf.cell(0, 8, f"Téléphone: {self.client_vars.get('Téléphone client').get()}", ln=True)
-        pdf.cell(0, 8, f"E-mail: {self.client_vars.get('E-mail client').get()}", ln=True)
-        pdf.cell(0, 8, f"N° TVA: {self.client_vars.get('N° TVA client').get()}", ln=True)
+        def submit():
+            # Hors de la boucle Tk : la première préparation de la police (réduction
+            # par fontTools, métriques PyFPDF) prend du temps. Elle est faite une
+            # fois pour toutes avant le rendu, les processus la partagent ensuite.
+            try:
+                with timing.span("generate_pdf.police"):
+                    fonts.prepare(profil)
+                future = self.pdf_executor.submit(render.render_invoice, profil, client, lignes, filename, date, numero)
+            except Exception as e:
+                from concurrent.futures import Future
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda f: self.pdf_queue.put((f, infos)))
 
-        pdf.ln(10)
+        threading.Thread(target=submit, daemon=True).start()
 
-        pdf.cell(0, 10, f"Date: {datetime.now().strftime('%d/%m/%Y')}", ln=True)
+        self.pdf_pending += 1
+        self.show_pdf_status(f"Génération de {custom_filename}.pdf...")
+        if self.pdf_pending == 1:
+            self.after(self.PDF_POLL_MS, self.poll_pdf_queue)
 
-        headers = ["Produit", "Prix Unitaire HT", "Quantité", "TVA (%)", "Remise (%)", "Total HT"]
-        col_widths = [50, 30, 20, 20, 20, 30]
+    def poll_pdf_queue(self):
+        # Appelé dans la boucle Tk : traite les rendus terminés par les processus
+        while not self.pdf_queue.empty():
+            future, (filename, relpath, numero, date, client, lignes, edits) = self.pdf_queue.get_nowait()
+            self.pdf_pending -= 1
+            try:
+                resultat = future.result()
+            except Exception as e:
+                # Le numéro non utilisé est rendu, ou enregistré comme annulé (voir numbering.release),
+                # et le fichier réservé par generate_pdf supprimé
+                with numbering.Allocator() as allocator:
+                    allocator.release(numero)
+                if os.path.exists(filename):
+                    os.remove(filename)
+                self.show_pdf_status("")
+                messagebox.showerror("Erreur", f"Erreur lors de la génération de {filename} : {e}")
+                continue
 
-        pdf.set_font('Arial', 'B', 12)
-        for i, header in enumerate(headers):
-            pdf.cell(col_widths[i], 10, header, border=1, align='C')
-        pdf.ln()
+            with timing.span("generate_pdf.index"):
+                conn = index.connect()
+                index.record_invoice(conn, relpath, numero, date, client.get("Nom du client", ""), resultat,
+                                     client, lignes)
+                conn.close()
 
-        pdf.set_font('Arial', '', 12)
-        for child in self.tree.get_children():
-            vals = self.tree.item(child)['values']
-            for i, val in enumerate(vals):
-                pdf.cell(col_widths[i], 10, str(val), border=1)
-            pdf.ln()
+            self.show_pdf_status(f"Facture générée et sauvegardée sous {filename}")
+            if self.draft.edits == edits:
+                # Facture émise : la relancer au prochain démarrage la dupliquerait
+                self.clear_invoice_form()
+            if "Historique" in self.built_tabs:
+                with timing.span("generate_pdf.historique"):
+                    self.load_invoice_history()
+            if "Rapports" in self.built_tabs:
+                # Les cumuls viennent d'être mis à jour : relecture de quelques lignes
+                self.load_report()
 
-        pdf.ln(5)
+        if self.pdf_pending:
+            self.after(self.PDF_POLL_MS, self.poll_pdf_queue)
 
-        euro = chr(128)
-        pdf.cell(0, 10, f"Total HT: {self.total_ht_var.get()} {euro}", ln=True, align='R')
-        pdf.cell(0, 10, f"Total Remise: {self.total_remise_var.get()} {euro}", ln=True, align='R')
-        pdf.cell(0, 10, f"Total TVA: {self.total_tva_var.get()} {euro}", ln=True, align='R')
-        pdf.cell(0, 10, f"Total TTC: {self.total_ttc_var.get()} {euro}", ln=True, align='R')
+    def new_invoice(self):
+        if (len(self.lines) or any(var.get() for var in self.client_vars.values())) and not messagebox.askyesno(
+                "Nouvelle facture", "Abandonner la facture en cours de saisie ?"):
+            return
+        self.clear_invoice_form()
 
-        pdf.output(filename)
+    def clear_invoice_form(self):
+        # Journal vidé d'abord : la remise à blanc des champs n'y ajoute rien
+        self.draft.clear()
+        for var in self.client_vars.values():
+            var.set("")
+        self.show_lines_window(0)
+        self.show_totals(self.lines.totals())
 
-        messagebox.showinfo("Succès", f"Facture générée et sauvegardée sous {filename}")
+    def on_close(self):
+        if "Nouvelle Facture" in self.built_tabs:
+            self.draft.close()
+        self.destroy()
 
-        self.load_invoice_history()
+    def show_pdf_status(self, message):
+        if self.pdf_pending:
+            message = f"{message} ({self.pdf_pending} en cours)"
+        self.pdf_status_var.set(message)
 
     def add_product_line(self):
         try:
@@ -461,11 +760,12 @@ class FacturationApp(ctk.CTk):
             tva = float(self.entry_vars["TVA (%)"].get())
             remise = float(self.entry_vars["Remise (%)"].get() or 0)
 
-            total_ht = prix_ht * quantite * (1 - remise / 100)
-
-            self.tree.insert('', 'end', values=(produit, f"{prix_ht:.2f}", quantite, f"{tva:.2f}", f"{remise:.2f}", f"{total_ht:.2f}"))
-
-            self.update_totals()
+            with timing.span("add_product_line"):
+                line_id = self.lines.append(produit, prix_ht, quantite, tva, remise)
+                self.draft.added(line_id)
+                # Afficher la fin du tableau, où la ligne vient d'être ajoutée
+                self.show_lines_window(len(self.lines))
+                self.show_totals(self.lines.totals())
 
             for var in self.entry_vars.values():
                 var.set("")
@@ -473,110 +773,312 @@ class FacturationApp(ctk.CTk):
         except ValueError:
             messagebox.showerror("Erreur", "Veuillez entrer des valeurs numériques valides pour le prix, la quantité, la TVA et la remise.")
 
-    def update_totals(self):
-        total_ht = 0.0
-        total_tva = 0.0
-        total_remise = 0.0
-
-        for child in self.tree.get_children():
-            vals = self.tree.item(child)['values']
-            prix_ht = float(vals[1])
-            quantite = int(vals[2])
-            tva = float(vals[3])
-            remise = float(vals[4])
+    def show_totals(self, resultat):
+        self.total_ht_var.set(totals.format_cents(resultat.ht))
+        self.total_remise_var.set(totals.format_cents(resultat.remise))
+        self.total_tva_var.set(totals.format_cents(resultat.tva))
+        self.total_ttc_var.set(totals.format_cents(resultat.ttc))
 
-            line_ht = prix_ht * quantite
-            line_remise = line_ht * remise / 100
-            line_tva = (line_ht - line_remise) * tva / 100
-
-            total_ht += line_ht
-            total_remise += line_remise
-            total_tva += line_tva
+    def update_totals(self):
+        # Recalcul complet à la demande : contrôle de cohérence des totaux cumulés
+        with timing.span("update_totals", lignes=len(self.lines)):
+            # Même moteur que les traitements par lot, sur les colonnes du stockage
+            resultat = self.lines.recompute()
 
-        total_ttc = total_ht - total_remise + total_tva
+        if resultat != self.lines.totals():
+            messagebox.showwarning("Attention", "Les totaux cumulés étaient incohérents, ils ont été recalculés.")
+        self.lines.running.reset(resultat)
+        self.show_totals(resultat)
 
-        self.total_ht_var.set(f"{total_ht:.2f}")
-        self.total_remise_var.set(f"{total_remise:.2f}")
-        self.total_tva_var.set(f"{total_tva:.2f}")
-        self.total_ttc_var.set(f"{total_ttc:.2f}")
+    HISTORY_PREFETCH = 50  # lignes chargées en plus de la fenêtre visible
+    HISTORY_POLL_MS = 5000  # période de l'actualisation automatique
 
-    def create_historique_view(self):
-        frame = self.historique_frame
+    def create_historique_view(self, parent_frame):
+        frame = parent_frame
         
         # Titre de la section
         title_label = ttk.Label(frame, text="Historique des factures", 
                                font=("Segoe UI", 16, "bold"), 
                                foreground=self.colors["primary"])
         title_label.grid(row=0, column=0, columnspan=2, sticky='w', padx=10, pady=(0, 20))
+
+        # Filtres appliqués par l'index (client, période, recherche dans le contenu)
+        filter_frame = ttk.Frame(frame)
+        filter_frame.grid(row=1, column=0, columnspan=2, sticky='w', padx=10)
+
+        self.history_filter_vars = {}
+        for i, label_text in enumerate(["Client", "Du (jj/mm/aaaa)", "Au (jj/mm/aaaa)"]):
+            ttk.Label(filter_frame, text=label_text).grid(row=0, column=2 * i, padx=5)
+            var = tk.StringVar()
+            entry = ttk.Entry(filter_frame, textvariable=var, width=20 if i == 0 else 12)
+            entry.grid(row=0, column=2 * i + 1, padx=5)
+            entry.bind("<Return>", lambda event: self.apply_history_filters())
+            self.history_filter_vars[label_text] = var
+
+        filter_button = ttk.Button(filter_frame, text="Filtrer", command=self.apply_history_filters)
+        filter_button.grid(row=0, column=6, padx=5)
+
+        ttk.Label(filter_frame, text="Recherche").grid(row=1, column=0, padx=5, pady=(5, 0))
+        self.history_search_var = tk.StringVar()
+        search_entry = ttk.Entry(filter_frame, textvariable=self.history_search_var, width=60)
+        search_entry.grid(row=1, column=1, columnspan=5, sticky='we', padx=5, pady=(5, 0))
+        search_entry.bind("<Return>", lambda event: self.apply_history_filters())
+        ttk.Label(filter_frame, text='ex. client:dupont produit:"vis inox" ttc:1000-5000',
+                  foreground="gray").grid(row=2, column=1, columnspan=5, sticky='w', padx=5)
         
-        # Créer un Treeview pour afficher l'historique des factures
+        # Créer un Treeview pour afficher l'historique des factures.
+        # Seules les lignes visibles y sont insérées : la fenêtre est lue dans l'index.
         columns = ("Date", "Numéro", "Client", "Total HT", "Total TTC")
         self.history_tree = ttk.Treeview(frame, columns=columns, show='headings', height=15)
         
         for i, col in enumerate(columns):
-            self.history_tree.heading(col, text=col)
+            self.history_tree.heading(col, text=col, command=lambda c=col: self.sort_history(c))
             width = 150 if i < 2 else 120
             self.history_tree.column(col, width=width)
             
-        self.history_tree.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+        self.history_tree.grid(row=2, column=0, sticky='nsew', padx=10, pady=10)
         
-        # Scrollbar pour l'historique
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.history_tree.yview)
-        scrollbar.grid(row=1, column=1, sticky='ns')
-        self.history_tree.configure(yscrollcommand=scrollbar.set)
+        # Scrollbar pour l'historique, pilotée par la position dans l'index
+        self.history_scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.scroll_history)
+        self.history_scrollbar.grid(row=2, column=1, sticky='ns')
+
+        self.history_tree.bind("<MouseWheel>", lambda event: self.scroll_history("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.history_tree.bind("<Button-4>", lambda event: self.scroll_history("scroll", -1, "units"))
+        self.history_tree.bind("<Button-5>", lambda event: self.scroll_history("scroll", 1, "units"))
+        self.history_tree.bind("<Configure>", self.resize_history)
         
         # Cadre pour les boutons d'action
         button_frame = ttk.Frame(frame)
-        button_frame.grid(row=2, column=0, columnspan=2, sticky='e', padx=10, pady=20)
+        button_frame.grid(row=3, column=0, columnspan=2, sticky='e', padx=10, pady=20)
         
+        # Actualisation : seuls les changements sur disque depuis la fois précédente sont appliqués
+        self.history_auto_var = tk.BooleanVar(value=False)
+        auto_check = ttk.Checkbutton(button_frame, text="Actualisation automatique",
+                                     variable=self.history_auto_var, command=self.toggle_history_polling)
+        auto_check.pack(side='left', padx=5)
+
         refresh_button = ttk.Button(button_frame, text="Actualiser", 
-                                   command=self.load_invoice_history)
+                                   command=self.refresh_history)
         refresh_button.pack(side='left', padx=5)
         
+        export_button = ttk.Button(button_frame, text="Exporter...", command=self.export_history)
+        export_button.pack(side='left', padx=5)
+
         open_button = ttk.Button(button_frame, text="Ouvrir la facture", 
                                 command=self.open_invoice)
         open_button.pack(side='left', padx=5)
+
+        # Avancement des exports en cours
+        self.export_status_var = tk.StringVar()
+        ttk.Label(frame, textvariable=self.export_status_var).grid(row=4, column=0, columnspan=2, sticky='e', padx=10)
         
         # Double-clic pour ouvrir une facture
         self.history_tree.bind("<Double-1>", lambda event: self.open_invoice())
         
         # Configurer l'expansion des lignes et colonnes
         frame.columnconfigure(0, weight=1)
-        frame.rowconfigure(1, weight=1)
+        frame.rowconfigure(2, weight=1)
+
+        # État de la fenêtre affichée
+        self.history_conn = index.connect()
+        self.history_filters = {}
+        self.history_sort = ("Date", True)
+        self.history_offset = 0
+        self.history_page_size = 15
+        self.history_count = 0
+        self.history_cache_start = 0
+        self.history_cache = []
+        self.history_sync_queue = queue.Queue()
+        self.history_syncing = False
+        self.history_poll_job = None
+        self.export_queue = queue.Queue()
+        self.exporting = False
         
-        # Charger l'historique des factures
+        # Charger l'historique des factures, puis le mettre en accord avec le disque
         self.load_invoice_history()
+        self.refresh_history()
     
     def load_invoice_history(self):
-        # Effacer l'historique actuel
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-            
-        # Obtenir le chemin absolu du dossier factures
-        factures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'factures')
-            
-        # Vérifier si le dossier factures existe
-        if not os.path.exists(factures_dir):
+        # Recompte et invalide le cache ; seule la fenêtre visible est relue
+        self.history_count = index.count_invoices(self.history_conn, self.history_filters)
+        self.history_cache = []
+        self.show_history_window(self.history_offset)
+
+    def refresh_history(self):
+        # Synchronisation de l'index avec le disque dans un thread (connexion SQLite dédiée)
+        if self.history_syncing:
             return
-            
-        # Lister tous les fichiers PDF dans le dossier factures
-        for filename in os.listdir(factures_dir):
-            if filename.endswith('.pdf'):
-                # Obtenir la date de création du fichier
-                filepath = os.path.join(factures_dir, filename)
-                from datetime import datetime
-                import time
-                
-                # Obtenir la date de création du fichier
-                creation_time = os.path.getctime(filepath)
-                date_obj = datetime.fromtimestamp(creation_time)
-                date_formatted = date_obj.strftime('%d/%m/%Y %H:%M')
-                
-                # Extraire le nom du client si possible (pour les nouveaux fichiers)
-                client_name = "--"
-                
-                # Insérer dans l'historique
-                self.history_tree.insert('', 'end', values=(date_formatted, filename, client_name, "--", "--"), tags=(filename,))
+        self.history_syncing = True
+        threading.Thread(target=self.sync_history_worker, daemon=True).start()
+        self.after(self.PDF_POLL_MS, self.poll_history_sync)
+
+    def sync_history_worker(self):
+        try:
+            with timing.span("historique.sync"):
+                conn = index.connect()
+                try:
+                    changes = index.sync(conn)
+                finally:
+                    conn.close()
+            self.history_sync_queue.put(changes)
+        except Exception as e:
+            self.history_sync_queue.put(e)
+
+    def poll_history_sync(self):
+        try:
+            result = self.history_sync_queue.get_nowait()
+        except queue.Empty:
+            self.after(self.PDF_POLL_MS, self.poll_history_sync)
+            return
+        self.history_syncing = False
+        if isinstance(result, Exception):
+            messagebox.showerror("Erreur", f"Erreur lors de l'actualisation de l'historique : {result}")
+            return
+        # Rien n'a changé sur disque : la vue est laissée telle quelle
+        if any(result.values()):
+            self.load_invoice_history()
+
+    def export_history(self):
+        # Exporte toutes les factures de la liste filtrée, pas seulement la fenêtre affichée
+        if self.exporting:
+            messagebox.showwarning("Attention", "Un export est déjà en cours.")
+            return
+        path = filedialog.asksaveasfilename(title="Exporter les factures", defaultextension=".zip",
+                                            filetypes=[("Archive ZIP", "*.zip"), ("PDF fusionné", "*.pdf")])
+        if not path:
+            return
+        fmt = "pdf" if path.lower().endswith(".pdf") else "zip"
+        self.exporting = True
+        self.export_status_var.set("Export en cours...")
+        threading.Thread(target=self.export_worker, args=(path, fmt, dict(self.history_filters)), daemon=True).start()
+        self.after(self.PDF_POLL_MS, self.poll_export_queue)
+
+    def export_worker(self, path, fmt, filtres):
+        import export
+        try:
+            with timing.span("historique.export", format=fmt):
+                result = export.export(path, fmt, filtres,
+                                       progress=lambda fait, total: self.export_queue.put((fait, total)))
+            self.export_queue.put((path, result))
+        except Exception as e:
+            self.export_queue.put(e)
+
+    def poll_export_queue(self):
+        while not self.export_queue.empty():
+            message = self.export_queue.get_nowait()
+            if isinstance(message, Exception):
+                self.exporting = False
+                self.export_status_var.set("")
+                messagebox.showerror("Erreur", f"Erreur lors de l'export : {message}")
+                return
+            if isinstance(message[0], int):
+                fait, total = message
+                self.export_status_var.set(f"Export : {fait}/{total} facture(s)")
+                continue
+            path, (exportees, manquants, ecrits) = message
+            self.exporting = False
+            self.export_status_var.set("")
+            if len(ecrits) > 1:
+                # PDF découpé en volumes (voir export._to_pdf) : path lui-même n'existe pas
+                noms = "\n".join(ecrits[:10]) + ("\n..." if len(ecrits) > 10 else "")
+                lieu = f"{len(ecrits)} volumes :\n{noms}"
+            else:
+                lieu = ecrits[0] if ecrits else path
+            detail = f"\n{manquants} facture(s) introuvable(s) sur disque." if manquants else ""
+            messagebox.showinfo("Succès", f"{exportees} facture(s) exportée(s) dans {lieu}{detail}")
+            return
+        self.after(self.PDF_POLL_MS, self.poll_export_queue)
+
+    def toggle_history_polling(self):
+        if self.history_poll_job is not None:
+            self.after_cancel(self.history_poll_job)
+            self.history_poll_job = None
+        if self.history_auto_var.get():
+            self.poll_history_changes()
+
+    def poll_history_changes(self):
+        # Actualisation périodique : les factures écrites par d'autres processus apparaissent
+        self.refresh_history()
+        self.history_poll_job = self.after(self.HISTORY_POLL_MS, self.poll_history_changes)
+
+    def history_rows(self, offset, limit):
+        # Fenêtre servie depuis le cache, rechargé avec une marge autour si besoin
+        start = offset - self.history_cache_start
+        cache_end = self.history_cache_start + len(self.history_cache)
+        if start < 0 or not self.history_cache or (start + limit > len(self.history_cache) and cache_end < self.history_count):
+            self.history_cache_start = max(0, offset - self.HISTORY_PREFETCH)
+            tri, descendant = self.history_sort
+            self.history_cache = index.page_invoices(
+                self.history_conn, self.history_filters, tri, descendant,
+                self.history_cache_start, limit + 2 * self.HISTORY_PREFETCH)
+            start = offset - self.history_cache_start
+        return self.history_cache[start:start + limit]
+
+    def show_history_window(self, offset):
+        from datetime import datetime
+        offset = max(0, min(offset, self.history_count - self.history_page_size))
+        self.history_offset = offset
+
+        self.history_tree.delete(*self.history_tree.get_children())
+        for fichier, numero, date, client, total_ht, total_ttc in self.history_rows(offset, self.history_page_size):
+            date_formatted = datetime.fromisoformat(date).strftime('%d/%m/%Y %H:%M') if date else "--"
+            ht = totals.format_cents(total_ht) if total_ht is not None else "--"
+            ttc = totals.format_cents(total_ttc) if total_ttc is not None else "--"
+            # L'identifiant de la ligne est le nom du fichier PDF
+            self.history_tree.insert('', 'end', iid=fichier, values=(date_formatted, numero, client or "--", ht, ttc))
+
+        if self.history_count:
+            first = offset / self.history_count
+            last = min(1.0, (offset + self.history_page_size) / self.history_count)
+            self.history_scrollbar.set(first, last)
+        else:
+            self.history_scrollbar.set(0, 1)
+
+    def scroll_history(self, action, value, unit=None):
+        if action == "moveto":
+            offset = int(float(value) * self.history_count)
+        elif unit == "pages":
+            offset = self.history_offset + int(value) * self.history_page_size
+        else:
+            offset = self.history_offset + int(value)
+        self.show_history_window(offset)
+
+    def resize_history(self, event):
+        # Nombre de lignes visibles selon la hauteur du Treeview (en-tête déduit)
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        page_size = max(1, (event.height - 25) // row_height)
+        if page_size != self.history_page_size:
+            self.history_page_size = page_size
+            self.show_history_window(self.history_offset)
+
+    def sort_history(self, column):
+        tri, descendant = self.history_sort
+        self.history_sort = (column, not descendant if column == tri else False)
+        self.history_offset = 0
+        self.load_invoice_history()
+
+    def apply_history_filters(self):
+        from datetime import datetime, timedelta
+        filtres = {"client": self.history_filter_vars["Client"].get().strip()}
+        try:
+            debut = self.history_filter_vars["Du (jj/mm/aaaa)"].get().strip()
+            fin = self.history_filter_vars["Au (jj/mm/aaaa)"].get().strip()
+            if debut:
+                filtres["date_min"] = datetime.strptime(debut, '%d/%m/%Y')
+            if fin:
+                # Borne incluse : jusqu'à la fin de la journée
+                filtres["date_max"] = datetime.strptime(fin, '%d/%m/%Y') + timedelta(days=1, seconds=-1)
+        except ValueError:
+            messagebox.showerror("Erreur", "Veuillez saisir les dates au format jj/mm/aaaa.")
+            return
+        try:
+            filtres["recherche"] = search.parse_query(self.history_search_var.get())
+        except ValueError as e:
+            messagebox.showerror("Erreur", str(e))
+            return
+        self.history_filters = filtres
+        self.history_offset = 0
+        self.load_invoice_history()
     
     def open_invoice(self):
         selected = self.history_tree.selection()
@@ -584,15 +1086,127 @@ class FacturationApp(ctk.CTk):
             messagebox.showwarning("Attention", "Veuillez sélectionner une facture à ouvrir.")
             return
             
-        item = selected[0]
-        filename = self.history_tree.item(item, 'values')[1]  # Le nom du fichier est dans la deuxième colonne
-        factures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'factures')
-        filepath = os.path.join(factures_dir, filename)
+        # L'identifiant de la ligne est le chemin relatif dans l'archive
+        # (extraite du stockage froid si la facture y a été rangée)
+        filepath = coldstore.materialize(selected[0])
         
-        if os.path.exists(filepath):
+        if filepath:
+            import webbrowser
             webbrowser.open(filepath)
         else:
-            messagebox.showerror("Erreur", f"Le fichier {filepath} n'existe pas.")
+            messagebox.showerror("Erreur", f"Le fichier {archive.resolve(selected[0])} n'existe pas.")
+
+    # Regroupements proposés dans l'onglet Rapports -> axes de reports.report
+    REPORT_GROUPS = {
+        "Mois et taux de TVA": ("mois", "taux"),
+        "Mois": ("mois",),
+        "Client": ("client",),
+        "Taux de TVA": ("taux",),
+        "Client et mois": ("client", "mois"),
+    }
+
+    def create_rapports_view(self, parent_frame):
+        frame = parent_frame
+
+        title_label = ttk.Label(frame, text="Rapports de chiffre d'affaires et de TVA",
+                               font=("Segoe UI", 16, "bold"),
+                               foreground=self.colors["primary"])
+        title_label.grid(row=0, column=0, columnspan=2, sticky='w', padx=10, pady=(0, 20))
+
+        options_frame = ttk.Frame(frame)
+        options_frame.grid(row=1, column=0, columnspan=2, sticky='w', padx=10)
+
+        ttk.Label(options_frame, text="Regrouper par").grid(row=0, column=0, padx=5)
+        self.report_group_var = tk.StringVar(value=next(iter(self.REPORT_GROUPS)))
+        group_combo = ttk.Combobox(options_frame, textvariable=self.report_group_var,
+                                   values=list(self.REPORT_GROUPS), state="readonly", width=22)
+        group_combo.grid(row=0, column=1, padx=5)
+        group_combo.bind("<<ComboboxSelected>>", lambda event: self.load_report())
+
+        ttk.Label(options_frame, text="Année").grid(row=0, column=2, padx=5)
+        self.report_year_var = tk.StringVar()
+        year_entry = ttk.Entry(options_frame, textvariable=self.report_year_var, width=8)
+        year_entry.grid(row=0, column=3, padx=5)
+        year_entry.bind("<Return>", lambda event: self.load_report())
+
+        ttk.Label(options_frame, text="Client").grid(row=0, column=4, padx=5)
+        self.report_client_var = tk.StringVar()
+        client_entry = ttk.Entry(options_frame, textvariable=self.report_client_var, width=20)
+        client_entry.grid(row=0, column=5, padx=5)
+        client_entry.bind("<Return>", lambda event: self.load_report())
+
+        show_button = ttk.Button(options_frame, text="Afficher", command=self.load_report)
+        show_button.grid(row=0, column=6, padx=5)
+
+        # Colonnes recréées à chaque rapport selon le regroupement choisi
+        self.report_tree = ttk.Treeview(frame, show='headings', height=15)
+        self.report_tree.grid(row=2, column=0, sticky='nsew', padx=10, pady=10)
+        report_scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.report_tree.yview)
+        report_scrollbar.grid(row=2, column=1, sticky='ns')
+        self.report_tree.configure(yscrollcommand=report_scrollbar.set)
+
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=3, column=0, columnspan=2, sticky='e', padx=10, pady=20)
+
+        rebuild_button = ttk.Button(button_frame, text="Recalculer les cumuls", command=self.rebuild_report)
+        rebuild_button.pack(side='left', padx=5)
+
+        export_button = ttk.Button(button_frame, text="Exporter en CSV...", command=self.export_report)
+        export_button.pack(side='left', padx=5)
+
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(2, weight=1)
+
+        self.load_report()
+
+    def report_options(self):
+        par = self.REPORT_GROUPS[self.report_group_var.get()]
+        annee = self.report_year_var.get().strip()
+        if annee and not (len(annee) == 4 and annee.isdigit()):
+            raise ValueError("Veuillez saisir l'année sur quatre chiffres (ex. 2026).")
+        bornes = (f"{annee}-01", f"{annee}-12") if annee else (None, None)
+        return par, bornes, self.report_client_var.get().strip() or None
+
+    def load_report(self):
+        try:
+            par, bornes, client = self.report_options()
+        except ValueError as e:
+            messagebox.showerror("Erreur", str(e))
+            return
+        conn = index.connect()
+        rows = reports.report(conn, par, *bornes, client=client)
+        conn.close()
+
+        columns = [reports.HEADERS[axe] for axe in par] + reports.AMOUNTS
+        self.report_tree.delete(*self.report_tree.get_children())
+        self.report_tree.configure(columns=columns)
+        for col in columns:
+            self.report_tree.heading(col, text=col)
+            self.report_tree.column(col, width=150 if col == "Client" else 110)
+        for row in rows:
+            self.report_tree.insert("", "end", values=reports.format_row(par, row))
+
+    def rebuild_report(self):
+        conn = index.connect()
+        reports.rebuild(conn)
+        conn.close()
+        self.load_report()
+
+    def export_report(self):
+        try:
+            par, bornes, client = self.report_options()
+        except ValueError as e:
+            messagebox.showerror("Erreur", str(e))
+            return
+        path = filedialog.asksaveasfilename(title="Exporter le rapport", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        conn = index.connect()
+        rows = reports.report(conn, par, *bornes, client=client)
+        conn.close()
+        reports.export_csv(rows, par, path)
+        messagebox.showinfo("Succès", f"Rapport exporté dans {path}")
 
 if __name__ == "__main__":
     app = FacturationApp()
@@ -0,0 +1,140 @@
+# Numérotation séquentielle des factures, une série par année : F2026-000001,
+# F2026-000002...
+#
+# Le compteur est dans l'index des factures ; chaque réservation se fait dans
+# une transaction SQLite exclusive (BEGIN IMMEDIATE), ce qui la rend sûre entre
+# l'interface et plusieurs traitements par lot lancés en même temps. Un
+# traitement par lot réserve des blocs de numéros pour ne prendre le verrou
+# qu'une fois par bloc.
+#
+# Un numéro n'est jamais réattribué : la série doit rester chronologique. Un
+# numéro réservé mais non utilisé (rendu en échec, fin de lot) qui termine la
+# série fait reculer le compteur ; sinon il est enregistré comme annulé dans
+# numeros_annules, avec la date et le motif, ce qui justifie le trou.
+from datetime import datetime
+
+import index
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS compteurs (
+    serie TEXT PRIMARY KEY,
+    suivant INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS numeros_annules (
+    serie TEXT,
+    numero INTEGER,
+    date TEXT,
+    motif TEXT,
+    PRIMARY KEY (serie, numero)
+);
+"""
+
+PREFIX = "F"
+WIDTH = 6
+
+
+def connect(factures_dir=None):
+    conn = index.connect(factures_dir)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def series(date):
+    return f"{date.year:04d}"
+
+
+def format_number(serie, numero):
+    return f"{PREFIX}{serie}-{numero:0{WIDTH}d}"
+
+
+def parse_number(texte):
+    # "F2026-000123" -> ("2026", 123)
+    serie, _, numero = texte[len(PREFIX):].partition('-')
+    if not texte.startswith(PREFIX) or not numero.isdigit():
+        raise ValueError(f"Numéro de facture invalide : {texte}")
+    return serie, int(numero)
+
+
+def reserve(conn, serie, taille=1):
+    """Réserve les `taille` numéros suivants de la série. Retourne la liste
+    des numéros, croissante."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT suivant FROM compteurs WHERE serie = ?", (serie,)).fetchone()
+        debut = row[0] if row else 1
+        conn.execute("INSERT OR REPLACE INTO compteurs VALUES (?, ?)", (serie, debut + taille))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return list(range(debut, debut + taille))
+
+
+def release(conn, serie, numeros, motif="non utilisé"):
+    """Rend des numéros réservés mais non émis. Ceux qui terminent la série
+    font reculer le compteur ; les autres sont enregistrés comme annulés."""
+    numeros = sorted(set(numeros))
+    if not numeros:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        suivant = conn.execute("SELECT suivant FROM compteurs WHERE serie = ?", (serie,)).fetchone()[0]
+        while numeros and numeros[-1] == suivant - 1:
+            suivant -= 1
+            numeros.pop()
+        conn.execute("UPDATE compteurs SET suivant = ? WHERE serie = ?", (suivant, serie))
+        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.executemany("INSERT OR IGNORE INTO numeros_annules VALUES (?, ?, ?, ?)",
+                         [(serie, numero, date, motif) for numero in numeros])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def voided(conn, serie=None):
+    # (numéro formaté, date, motif) des numéros annulés, pour justifier les trous de la série
+    sql = "SELECT serie, numero, date, motif FROM numeros_annules"
+    params = ()
+    if serie is not None:
+        sql += " WHERE serie = ?"
+        params = (serie,)
+    return [(format_number(s, n), date, motif) for s, n, date, motif in conn.execute(sql + " ORDER BY serie, numero", params)]
+
+
+class Allocator:
+    """Distribue les numéros d'un processus, réservés par blocs de `bloc`.
+
+    `close` rend les numéros du bloc courant qui n'ont pas servi (voir release).
+    """
+
+    def __init__(self, factures_dir=None, bloc=1):
+        self.conn = connect(factures_dir)
+        self.bloc = bloc
+        self.reserves = {}
+
+    def next(self, date):
+        serie = series(date)
+        reserves = self.reserves.setdefault(serie, [])
+        if not reserves:
+            # Le verrou n'est pris qu'une fois par bloc
+            reserves.extend(reversed(reserve(self.conn, serie, self.bloc)))
+        return format_number(serie, reserves.pop())
+
+    def release(self, numero, motif="rendu en échec"):
+        serie, n = parse_number(numero)
+        release(self.conn, serie, [n], motif)
+
+    def close(self):
+        try:
+            for serie, reserves in self.reserves.items():
+                release(self.conn, serie, reserves, "bloc non utilisé")
+            self.reserves = {}
+        finally:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
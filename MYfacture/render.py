@@ -0,0 +1,188 @@
+# Mise en page PDF d'une facture, sans dépendance à l'interface Tk.
+# Utilisé par la fenêtre principale (generate_pdf) et par le traitement par lot.
+import re
+from datetime import datetime
+
+from fpdf import FPDF
+
+import assets
+import fonts
+from lines import LineStore
+import timing
+import totals
+
+# Champs texte du profil d'entreprise (en plus de "Logo", "Police", "Police grasse")
+PROFILE_FIELDS = ["Nom de la société", "Adresse", "Téléphone", "E-mail", "Numéro SIRET"]
+CLIENT_FIELDS = ["Nom du client", "Adresse client", "Téléphone client", "E-mail client", "N° TVA client"]
+LINE_FIELDS = ["Produit", "Prix Unitaire HT", "Quantité", "TVA (%)", "Remise (%)"]
+
+HEADERS = ["Produit", "Prix Unitaire HT", "Quantité", "TVA (%)", "Remise (%)", "Total HT"]
+COL_WIDTHS = [50, 30, 20, 20, 20, 30]
+
+
+def clean_filename(name):
+    # Nettoyer le nom de fichier pour éviter les caractères invalides
+    return re.sub(r'[\\/*?:"<>|]', "_", name)
+
+
+def parse_line(ligne):
+    # Ligne de produit sous forme de dict (clés du formulaire) ou de tuple
+    if isinstance(ligne, dict):
+        ligne = [ligne.get(key, "") for key in LINE_FIELDS]
+    produit, prix, quantite, tva, remise = ligne
+    return (str(produit), float(prix), int(quantite), float(tva), float(remise or 0))
+
+
+class _InvoicePDF(FPDF):
+    # Répète les en-têtes de colonnes en haut de chaque page du tableau
+    template = None
+    police = 'Arial'
+
+    def header(self):
+        if self.template is not None:
+            self.template.draw_table_header(self)
+
+
+class InvoiceTemplate:
+    """Éléments constants de la mise en page d'un profil d'entreprise.
+
+    Les textes de l'en-tête société, la police, les en-têtes et largeurs de
+    colonnes sont préparés une fois par profil. FPDF ne sait pas réutiliser
+    une page d'un document à l'autre : ces éléments sont redessinés à chaque
+    facture, le gabarit n'en accélère pas sensiblement le rendu.
+    """
+
+    def __init__(self, profil):
+        self.logo = profil.get("Logo", "")
+        # (style, taille, texte) ; la famille dépend de la police du document
+        self.company_lines = [
+            (('B', 16), profil.get("Nom de la société", "")),
+            (('', 12), profil.get("Adresse", "")),
+            (('', 12), f"Téléphone: {profil.get('Téléphone', '')} - E-mail: {profil.get('E-mail', '')}"),
+            (('', 12), f"SIRET: {profil.get('Numéro SIRET', '')}"),
+        ]
+        self.client_labels = [
+            ("Nom: ", 'Nom du client'),
+            ("Adresse: ", 'Adresse client'),
+            ("Téléphone: ", 'Téléphone client'),
+            ("E-mail: ", 'E-mail client'),
+            ("N° TVA: ", 'N° TVA client'),
+        ]
+        self.table_header = list(zip(COL_WIDTHS, HEADERS))
+        self.row_widths = COL_WIDTHS
+        # Police TrueType Unicode si disponible (voir fonts.py), sinon Arial en latin-1
+        self.fontset = fonts.fontset_for(profil)
+        self.euro = "€" if self.fontset is not None else chr(128)
+        self.static_text = "".join(
+            [texte for _, texte in self.company_lines] + [label for label, _ in self.client_labels] +
+            HEADERS + ["Informations Client", "Facture N° Date: Total HT: Remise TVA TTC 0123456789.,-/", self.euro])
+
+    def draw_table_header(self, pdf):
+        pdf.set_font(pdf.police, 'B', 12)
+        for width, header in self.table_header:
+            pdf.cell(width, 10, header, border=1, align='C')
+        pdf.ln()
+        pdf.set_font(pdf.police, '', 12)
+
+    def render(self, client, lignes, filename, date=None, numero=None):
+        with timing.span("render_invoice", lignes=len(lignes)):
+            return self._render(client, lignes, filename, date, numero)
+
+    def _render(self, client, lignes, filename, date, numero):
+        date = date or datetime.now()
+        if isinstance(lignes, LineStore):
+            # Colonnes typées lues directement, sans conversion ligne par ligne
+            colonnes = (lignes.produits, lignes.prix, lignes.quantites, lignes.tvas, lignes.remises)
+        else:
+            lignes = [parse_line(ligne) for ligne in lignes]
+            colonnes = list(zip(*lignes)) if lignes else [[]] * 5
+
+        pdf = _InvoicePDF()
+        if self.fontset is not None:
+            with timing.span("render.police"):
+                texte = self.static_text + "".join(str(v) for v in client.values()) + "".join(colonnes[0])
+                if numero:
+                    texte += str(numero)
+                pdf.police = fonts.register(pdf, self.fontset, texte)
+        police = pdf.police
+        pdf.add_page()
+
+        # Logo réduit et mis en cache : pas de décodage de l'image d'origine à chaque facture
+        with timing.span("render.logo"):
+            logo_path = assets.logo_for_pdf(self.logo)
+            if logo_path:
+                pdf.image(logo_path, 10, 8, 33)
+
+        for font, text in self.company_lines:
+            pdf.set_font(police, *font)
+            pdf.cell(0, 10, text, ln=True, align='C')
+
+        pdf.ln(10)
+
+        # Add client information section
+        pdf.set_font(police, 'B', 14)
+        pdf.cell(0, 10, "Informations Client", ln=True)
+        pdf.set_font(police, '', 12)
+        for label, key in self.client_labels:
+            pdf.cell(0, 8, label + str(client.get(key, '')), ln=True)
+
+        pdf.ln(10)
+
+        if numero:
+            pdf.cell(0, 10, f"Facture N° {numero}", ln=True)
+        pdf.cell(0, 10, f"Date: {date.strftime('%d/%m/%Y')}", ln=True)
+
+        self.draw_table_header(pdf)
+        pdf.template = self
+
+        montants = totals.compute_lines(colonnes[1], colonnes[2], colonnes[3], colonnes[4])
+
+        widths = self.row_widths
+        with timing.span("render.lignes", lignes=len(lignes)):
+            for produit, prix, quantite, tva, remise, net in zip(*colonnes, montants.net):
+                pdf.cell(widths[0], 10, produit, border=1)
+                pdf.cell(widths[1], 10, f"{prix:.2f}", border=1)
+                pdf.cell(widths[2], 10, str(quantite), border=1)
+                pdf.cell(widths[3], 10, f"{tva:.2f}", border=1)
+                pdf.cell(widths[4], 10, f"{remise:.2f}", border=1)
+                pdf.cell(widths[5], 10, totals.format_cents(net), border=1)
+                pdf.ln()
+
+        # Fin du tableau : plus d'en-têtes de colonnes sur une éventuelle nouvelle page
+        pdf.template = None
+        pdf.ln(5)
+
+        resultat = totals.Totaux(int(sum(montants.ht)), int(sum(montants.remise)), int(sum(montants.tva)),
+                                 int(sum(montants.ttc)))
+        euro = self.euro
+        pdf.cell(0, 10, f"Total HT: {totals.format_cents(resultat.ht)} {euro}", ln=True, align='R')
+        pdf.cell(0, 10, f"Total Remise: {totals.format_cents(resultat.remise)} {euro}", ln=True, align='R')
+        pdf.cell(0, 10, f"Total TVA: {totals.format_cents(resultat.tva)} {euro}", ln=True, align='R')
+        pdf.cell(0, 10, f"Total TTC: {totals.format_cents(resultat.ttc)} {euro}", ln=True, align='R')
+
+        with timing.span("render.output"):
+            pdf.output(filename)
+        return resultat
+
+
+_templates = {}
+
+
+def get_template(profil):
+    # Un gabarit par contenu de profil, conservé dans le processus
+    key = tuple(sorted((k, str(v)) for k, v in profil.items()))
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) > 16:
+            _templates.clear()
+        template = _templates[key] = InvoiceTemplate(profil)
+    return template
+
+
+def render_invoice(profil, client, lignes, filename, date=None, numero=None):
+    """Écrit la facture PDF dans `filename` et retourne ses totaux (centimes).
+
+    `profil` et `client` sont des dicts aux clés du formulaire, `lignes` un
+    LineStore ou une liste de (produit, prix HT, quantité, TVA %, remise %).
+    """
+    return get_template(profil).render(client, lignes, filename, date, numero)
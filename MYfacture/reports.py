@@ -0,0 +1,195 @@
+# Rapports de chiffre d'affaires et de TVA par mois, par client et par taux.
+#
+# Chaque facture enregistrée avec ses lignes est ventilée par taux de TVA
+# (table ventilation) et ajoutée aux cumuls (mois, client, taux) : un rapport
+# annuel ne lit que ces cumuls, quelques lignes par mois, sans relire les
+# factures. Les tables sont dans l'index des factures (voir index.py).
+#
+#   python reports.py                          rapport par mois et taux, tout l'historique
+#   python reports.py --par client --annee 2026 --output rapport_2026.csv
+#   python reports.py --rebuild                recalcule les cumuls depuis le contenu indexé
+import argparse
+import csv
+import json
+import sys
+
+import totals
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ventilation (
+    fichier TEXT,
+    mois TEXT,
+    client TEXT,
+    taux INTEGER,
+    ht INTEGER,
+    remise INTEGER,
+    tva INTEGER,
+    ttc INTEGER,
+    PRIMARY KEY (fichier, taux)
+);
+CREATE TABLE IF NOT EXISTS cumuls (
+    mois TEXT,
+    client TEXT,
+    taux INTEGER,
+    ht INTEGER,
+    remise INTEGER,
+    tva INTEGER,
+    ttc INTEGER,
+    PRIMARY KEY (mois, client, taux)
+);
+"""
+
+# Axes de regroupement -> colonne des cumuls
+DIMENSIONS = {"mois": "mois", "client": "client", "taux": "taux"}
+HEADERS = {"mois": "Mois", "client": "Client", "taux": "TVA (%)"}
+AMOUNTS = ["Total HT", "Remise", "TVA", "Total TTC"]
+
+
+def _month(date):
+    return date.strftime('%Y-%m')
+
+
+def by_rate(lignes):
+    """Totaux d'une liste de lignes (produit, prix, quantité, tva, remise), par
+    taux de TVA en centièmes de pourcent : {taux: Totaux}."""
+    if not lignes:
+        return {}
+    _, prix, quantites, tvas, remises = zip(*lignes)
+    taux = sorted({totals.to_basis_points(t) for t in tvas})
+    codes = {t: i for i, t in enumerate(taux)}
+    groupes = [codes[totals.to_basis_points(t)] for t in tvas]
+    sommes = totals.compute_batch(groupes, prix, quantites, tvas, remises, len(taux))
+    return {t: totals.Totaux(*(int(colonne[i]) for colonne in sommes)) for i, t in enumerate(taux)}
+
+
+def _add(conn, mois, client, taux, ht, remise, tva, ttc):
+    conn.execute(
+        "INSERT INTO cumuls VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (mois, client, taux) DO UPDATE SET "
+        "ht = ht + excluded.ht, remise = remise + excluded.remise, tva = tva + excluded.tva, "
+        "ttc = ttc + excluded.ttc",
+        (mois, client, taux, ht, remise, tva, ttc),
+    )
+
+
+def record(conn, fichier, date, client, lignes):
+    # Appelé dans la transaction de index.record_invoice
+    forget(conn, fichier)
+    mois = _month(date)
+    client = client or ""
+    for taux, t in by_rate(lignes).items():
+        conn.execute("INSERT INTO ventilation VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (fichier, mois, client, taux, t.ht, t.remise, t.tva, t.ttc))
+        _add(conn, mois, client, taux, t.ht, t.remise, t.tva, t.ttc)
+
+
+def forget(conn, fichier):
+    # Retire des cumuls la contribution d'une facture supprimée ou remplacée
+    for mois, client, taux, ht, remise, tva, ttc in conn.execute(
+            "SELECT mois, client, taux, ht, remise, tva, ttc FROM ventilation WHERE fichier = ?",
+            (fichier,)).fetchall():
+        _add(conn, mois, client, taux, -ht, -remise, -tva, -ttc)
+        conn.execute("DELETE FROM cumuls WHERE mois = ? AND client = ? AND taux = ? AND ht = 0 AND tva = 0",
+                     (mois, client, taux))
+    conn.execute("DELETE FROM ventilation WHERE fichier = ?", (fichier,))
+
+
+def rebuild(conn):
+    """Recalcule ventilation et cumuls depuis le contenu de toutes les factures
+    indexées, en un seul calcul vectorisé sur l'ensemble de leurs lignes."""
+    groupes, prix, quantites, tvas, remises = [], [], [], [], []
+    cles = {}
+    for fichier, date, client, donnees in conn.execute(
+            "SELECT f.fichier, f.date, f.client, c.donnees FROM factures f JOIN contenus c USING (fichier)"):
+        mois = date[:7]
+        for _, p, q, t, r in json.loads(donnees)["lignes"]:
+            cle = (fichier, mois, client or "", totals.to_basis_points(t))
+            groupes.append(cles.setdefault(cle, len(cles)))
+            prix.append(p)
+            quantites.append(q)
+            tvas.append(t)
+            remises.append(r)
+    sommes = totals.compute_batch(groupes, prix, quantites, tvas, remises, len(cles))
+    ventilation = [cle + tuple(int(colonne[i]) for colonne in sommes) for cle, i in cles.items()]
+    with conn:
+        conn.execute("DELETE FROM ventilation")
+        conn.execute("DELETE FROM cumuls")
+        conn.executemany("INSERT INTO ventilation VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ventilation)
+        conn.execute(
+            "INSERT INTO cumuls SELECT mois, client, taux, SUM(ht), SUM(remise), SUM(tva), SUM(ttc) "
+            "FROM ventilation GROUP BY mois, client, taux")
+    return len(ventilation)
+
+
+def report(conn, par=("mois", "taux"), mois_min=None, mois_max=None, client=None):
+    """Lignes du rapport regroupées selon `par` (axes de DIMENSIONS) :
+    [(valeurs des axes..., ht, remise, tva, ttc)], montants en centimes.
+    `mois_min`/`mois_max` au format "AAAA-MM", bornes incluses."""
+    colonnes = [DIMENSIONS[axe] for axe in par]
+    clauses, params = [], []
+    if mois_min:
+        clauses.append("mois >= ?")
+        params.append(mois_min)
+    if mois_max:
+        clauses.append("mois <= ?")
+        params.append(mois_max)
+    if client:
+        clauses.append("client LIKE ?")
+        params.append(f"%{client}%")
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    select = ", ".join(colonnes + ["SUM(ht)", "SUM(remise)", "SUM(tva)", "SUM(ttc)"])
+    groupe = " GROUP BY " + ", ".join(colonnes) + " ORDER BY " + ", ".join(colonnes) if colonnes else ""
+    return conn.execute(f"SELECT {select} FROM cumuls{where}{groupe}", params).fetchall()
+
+
+def format_row(par, row):
+    # Valeurs affichables : taux en pourcent, montants en euros
+    valeurs = []
+    for axe, valeur in zip(par, row):
+        valeurs.append(f"{valeur / 100:g}" if axe == "taux" else valeur)
+    return valeurs + [totals.format_cents(montant) for montant in row[len(par):]]
+
+
+def export_csv(rows, par, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([HEADERS[axe] for axe in par] + AMOUNTS)
+        for row in rows:
+            writer.writerow(format_row(par, row))
+
+
+def main(argv=None):
+    import index
+
+    parser = argparse.ArgumentParser(description="Rapport de chiffre d'affaires et de TVA.")
+    parser.add_argument("--par", default="mois,taux", help="axes parmi mois, client, taux (défaut : mois,taux)")
+    parser.add_argument("--annee", help="limite le rapport à une année, ex. 2026")
+    parser.add_argument("--output", help="fichier CSV (défaut : affichage)")
+    parser.add_argument("--factures", help="dossier de l'archive (défaut : factures/)")
+    parser.add_argument("--rebuild", action="store_true", help="recalcule les cumuls avant le rapport")
+    args = parser.parse_args(argv)
+
+    par = tuple(axe.strip() for axe in args.par.split(',') if axe.strip())
+    inconnus = [axe for axe in par if axe not in DIMENSIONS]
+    if inconnus:
+        parser.error(f"axe inconnu : {', '.join(inconnus)}")
+
+    conn = index.connect(args.factures)
+    if args.rebuild:
+        print(f"{rebuild(conn)} ventilation(s) recalculée(s).", file=sys.stderr)
+    bornes = (f"{args.annee}-01", f"{args.annee}-12") if args.annee else (None, None)
+    rows = report(conn, par, *bornes)
+    conn.close()
+
+    if args.output:
+        export_csv(rows, par, args.output)
+        print(f"Rapport enregistré dans {args.output}")
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([HEADERS[axe] for axe in par] + AMOUNTS)
+        for row in rows:
+            writer.writerow(format_row(par, row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# Recherche dans le contenu des factures : index inversé des mots des champs
+# client et des libellés de produits, stocké avec l'index des factures.
+#
+# Syntaxe des requêtes (onglet Historique) :
+#   dupont                    un mot, dans le client ou les produits
+#   client:dupont             le client contient un mot commençant par "dupont"
+#   produit:"vis inox"        un produit contient "vis" et "inox"
+#   ttc:1000-5000             total TTC entre 1 000 et 5 000 (inclus)
+#   ttc>1000  ttc<5000        bornes séparées
+import json
+import re
+
+from catalog import normalize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contenus (
+    fichier TEXT PRIMARY KEY,
+    donnees TEXT
+);
+CREATE TABLE IF NOT EXISTS termes (
+    champ TEXT,
+    terme TEXT,
+    fichier TEXT
+);
+CREATE INDEX IF NOT EXISTS termes_recherche ON termes (champ, terme, fichier);
+CREATE INDEX IF NOT EXISTS termes_fichier ON termes (fichier);
+"""
+
+FIELDS = ("client", "produit")
+
+_WORD = re.compile(r"\w+")
+_CRITERE = re.compile(r'(\w+)\s*([:<>])\s*("[^"]*"|\S+)|("[^"]*"|\S+)')
+
+
+def tokenize(text):
+    return set(_WORD.findall(normalize(text)))
+
+
+def record_content(conn, fichier, client_fields, lignes):
+    """Enregistre le contenu structuré d'une facture et ses mots indexés.
+    `lignes` : (produit, prix HT, quantité, TVA %, remise %)."""
+    lignes = [list(ligne) for ligne in lignes]
+    delete_content(conn, fichier)
+    conn.execute("INSERT INTO contenus VALUES (?, ?)",
+                 (fichier, json.dumps({"client": client_fields, "lignes": lignes}, ensure_ascii=False)))
+    termes = {("client", mot) for valeur in client_fields.values() for mot in tokenize(valeur)}
+    termes.update(("produit", mot) for ligne in lignes for mot in tokenize(ligne[0]))
+    conn.executemany("INSERT INTO termes VALUES (?, ?, ?)", [(champ, mot, fichier) for champ, mot in termes])
+
+
+def delete_content(conn, fichier):
+    conn.execute("DELETE FROM contenus WHERE fichier = ?", (fichier,))
+    conn.execute("DELETE FROM termes WHERE fichier = ?", (fichier,))
+
+
+def load_content(conn, fichier):
+    row = conn.execute("SELECT donnees FROM contenus WHERE fichier = ?", (fichier,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _cents(texte):
+    # "1 000", "1,000" et "1,000.50" : séparateurs de milliers ; "12,50" : virgule décimale
+    texte = re.sub(r"[\s\u00a0\u202f]", "", texte)
+    if "," in texte and "." in texte:
+        texte = texte.replace(",", "")
+    elif re.fullmatch(r"\d{1,3}(,\d{3})+", texte):
+        texte = texte.replace(",", "")
+    else:
+        texte = texte.replace(",", ".")
+    return int(round(float(texte) * 100))
+
+
+def parse_query(texte):
+    """Critères d'une requête : {"client": [mots], "produit": [mots],
+    "tout": [mots], "ttc_min": centimes, "ttc_max": centimes}."""
+    criteres = {"client": [], "produit": [], "tout": []}
+    for champ, operateur, valeur, libre in _CRITERE.findall(texte):
+        if libre:
+            criteres["tout"].extend(tokenize(libre.strip('"')))
+            continue
+        champ = normalize(champ)
+        valeur = valeur.strip('"')
+        if champ in ("produit", "produits"):
+            champ = "produit"
+        if champ in FIELDS and operateur == ":":
+            criteres[champ].extend(tokenize(valeur))
+        elif champ == "ttc":
+            try:
+                if operateur == ":" and "-" in valeur:
+                    minimum, maximum = valeur.split("-", 1)
+                    criteres["ttc_min"], criteres["ttc_max"] = _cents(minimum), _cents(maximum)
+                elif operateur == ">":
+                    criteres["ttc_min"] = _cents(valeur)
+                elif operateur == "<":
+                    criteres["ttc_max"] = _cents(valeur)
+                else:
+                    criteres["ttc_min"] = criteres["ttc_max"] = _cents(valeur)
+            except ValueError:
+                raise ValueError(f"Montant invalide : {valeur}")
+        else:
+            criteres["tout"].extend(tokenize(valeur))
+    return criteres
+
+
+def where_clauses(criteres):
+    """Clauses SQL (sur la table factures) et paramètres correspondant aux critères.
+    Chaque mot est cherché par préfixe dans l'index (champ, terme)."""
+    clauses, params = [], []
+    for champ in FIELDS + ("tout",):
+        for mot in criteres.get(champ, ()):
+            if champ == "tout":
+                clauses.append("fichier IN (SELECT fichier FROM termes WHERE champ IN ('client', 'produit') "
+                               "AND terme >= ? AND terme < ?)")
+            else:
+                clauses.append("fichier IN (SELECT fichier FROM termes WHERE champ = ? AND terme >= ? AND terme < ?)")
+                params.append(champ)
+            params.extend((mot, mot + "\uffff"))
+    if criteres.get("ttc_min") is not None:
+        clauses.append("total_ttc >= ?")
+        params.append(criteres["ttc_min"])
+    if criteres.get("ttc_max") is not None:
+        clauses.append("total_ttc <= ?")
+        params.append(criteres["ttc_max"])
+    return clauses, params
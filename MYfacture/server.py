@@ -0,0 +1,318 @@
+# Service HTTP local de génération de factures, pour les autres logiciels
+# (export de l'ERP, boutique en ligne). Facultatif : l'interface n'en dépend pas.
+#
+#   python server.py --port 8765 --workers 4
+#
+#   POST /factures          une facture JSON -> {"numero", "fichier", "totaux"}
+#                           (?format=pdf ou Accept: application/pdf : le PDF lui-même)
+#   POST /factures/lot      {"factures": [...]} -> {"resultats": [...]}, dans l'ordre
+#   GET  /factures/<chemin> le PDF d'une facture de l'archive
+#   GET  /sante             état du service
+#
+# Une facture a le format d'une ligne du traitement par lot (voir batch.py) :
+# {"Date": "jj/mm/aaaa", "client": {...}, "lignes": [...]}, avec en option
+# "profil" : les champs texte de l'en-tête société (render.PROFILE_FIELDS) qui
+# remplacent ceux du service ; le logo et la police restent ceux du service,
+# une requête ne fait lire aucun fichier local. Le numéro (suivant de la
+# série, voir numbering.py) et le nom du fichier sont toujours attribués par
+# le service : une requête ne peut pas écraser une facture existante. Il n'est
+# attribué qu'une fois la facture vérifiée : une requête invalide n'en
+# consomme pas.
+#
+# Le rendu est confié à un groupe de processus ; l'index et la numérotation à
+# un seul thread qui possède les connexions SQLite. La boucle asyncio ne fait
+# que lire et écrire les requêtes : elle n'est jamais bloquée par un rendu.
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import archive
+import assets
+import batch
+import coldstore
+import fonts
+import index
+import numbering
+import render
+import totals
+
+MAX_BODY = 10 * 1024 * 1024
+MAX_BATCH = 500
+NUMBER_BLOCK = 20
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+          413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class InvoiceService:
+    """Génère les factures demandées par HTTP et les enregistre dans l'archive."""
+
+    def __init__(self, profil, output_dir=None, workers=None):
+        self.profil = profil
+        self.output_dir = output_dir or archive.FACTURES_DIR
+        self.workers = workers or os.cpu_count() or 1
+        fonts.prepare(profil)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=batch._init_worker,
+                                        initargs=(profil,))
+        self.db = ThreadPoolExecutor(max_workers=1)
+        # Rendus en vol bornés : les requêtes en surplus attendent sans charger la mémoire
+        self.slots = asyncio.Semaphore(self.workers * 4)
+        self.en_cours = 0
+        self._conn = None
+        self._allocator = None
+
+    # Méthodes exécutées dans le thread self.db
+
+    def _allocate(self, date):
+        if self._allocator is None:
+            self._allocator = numbering.Allocator(self.output_dir, NUMBER_BLOCK)
+        return self._allocator.next(date)
+
+    def _release(self, numero):
+        self._allocator.release(numero)
+
+    def _record(self, record, *result):
+        if self._conn is None:
+            self._conn = index.connect(self.output_dir)
+        batch.index_record(self._conn, record, *result)
+
+    def _close_db(self):
+        if self._allocator is not None:
+            self._allocator.close()
+        if self._conn is not None:
+            self._conn.close()
+
+    def close(self):
+        self.db.submit(self._close_db).result()
+        self.db.shutdown()
+        self.pool.shutdown()
+
+    async def generate(self, record):
+        if not isinstance(record, dict) or not isinstance(record.get("lignes"), list):
+            raise HTTPError(400, "Une facture est un objet JSON avec une liste \"lignes\".")
+        if "Numéro" in record or "Fichier" in record:
+            raise HTTPError(400, "Le numéro et le fichier d'une facture sont attribués par le service.")
+        record = dict(record)
+        profil = self._profile(record.pop("profil", None))
+        try:
+            batch.check_record(record)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        date = batch.record_date(record)
+
+        loop = asyncio.get_running_loop()
+        attribue = record["Numéro"] = await loop.run_in_executor(self.db, self._allocate, date)
+        async with self.slots:
+            self.en_cours += 1
+            try:
+                result = await loop.run_in_executor(self.pool, batch.render_record, record, self.output_dir, profil)
+            except Exception as e:
+                await loop.run_in_executor(self.db, self._release, attribue)
+                raise HTTPError(400, f"{type(e).__name__}: {e}")
+            finally:
+                self.en_cours -= 1
+        await loop.run_in_executor(self.db, self._record, record, *result)
+
+        relpath, numero, _, _, resultat = result
+        return {
+            "numero": numero,
+            "fichier": relpath,
+            "chemin": archive.resolve(relpath, self.output_dir),
+            "totaux": {champ: totals.format_cents(valeur) for champ, valeur in resultat._asdict().items()},
+        }
+
+    def _profile(self, profil):
+        # Profil de la requête : champs texte seulement, sur le profil du service
+        if profil is None:
+            return None
+        if not isinstance(profil, dict) or any(
+                champ not in render.PROFILE_FIELDS or not isinstance(valeur, str) for champ, valeur in profil.items()):
+            raise HTTPError(400, "Le profil d'une facture ne peut contenir que les champs texte "
+                                 + ", ".join(render.PROFILE_FIELDS) + ".")
+        return {**self.profil, **profil}
+
+    async def generate_batch(self, records):
+        async def one(record):
+            try:
+                return await self.generate(record)
+            except HTTPError as e:
+                return {"erreur": str(e)}
+        return await asyncio.gather(*(one(record) for record in records))
+
+    def read_pdf(self, relpath):
+        # Uniquement des PDF de l'archive : pas de remontée hors du dossier
+        parties = relpath.split('/')
+        if not relpath.endswith('.pdf') or any(p in ("", ".", "..") for p in parties):
+            raise HTTPError(404, "Facture introuvable.")
+        path = archive.resolve(relpath, self.output_dir)
+        if not os.path.isfile(path):
+            # Facture ancienne rangée dans le stockage froid
+            conn = index.connect(self.output_dir)
+            try:
+                contenu = coldstore.read(conn, relpath, self.output_dir)
+            finally:
+                conn.close()
+            if contenu is None:
+                raise HTTPError(404, "Facture introuvable.")
+            return contenu
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def dispatch(self, methode, cible, entetes, corps):
+        url = urlsplit(cible)
+        chemin = unquote(url.path).rstrip('/')
+        loop = asyncio.get_running_loop()
+
+        if chemin == "/sante":
+            return _json(200, {"statut": "ok", "en_cours": self.en_cours, "processus": self.workers})
+
+        if chemin.startswith("/factures/") and chemin != "/factures/lot":
+            if methode != "GET":
+                raise HTTPError(405, "Méthode non autorisée.")
+            contenu = await loop.run_in_executor(None, self.read_pdf, chemin[len("/factures/"):])
+            return 200, "application/pdf", contenu
+
+        if chemin not in ("/factures", "/factures/lot"):
+            raise HTTPError(404, "Ressource inconnue.")
+        if methode != "POST":
+            raise HTTPError(405, "Méthode non autorisée.")
+        try:
+            donnees = json.loads(corps or b"null")
+        except ValueError as e:
+            raise HTTPError(400, f"JSON invalide : {e}")
+
+        if chemin == "/factures/lot":
+            records = donnees.get("factures") if isinstance(donnees, dict) else donnees
+            if not isinstance(records, list):
+                raise HTTPError(400, "Le lot est une liste de factures ou {\"factures\": [...]}.")
+            if len(records) > MAX_BATCH:
+                raise HTTPError(413, f"Lot limité à {MAX_BATCH} factures.")
+            return _json(200, {"resultats": await self.generate_batch(records)})
+
+        resultat = await self.generate(donnees)
+        veut_pdf = parse_qs(url.query).get("format") == ["pdf"] or "application/pdf" in entetes.get("accept", "")
+        if veut_pdf:
+            contenu = await loop.run_in_executor(None, self.read_pdf, resultat["fichier"])
+            return 200, "application/pdf", contenu
+        return _json(200, resultat)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    requete = await _read_request(reader)
+                except HTTPError as e:
+                    _write_response(writer, *_json(e.status, {"erreur": str(e)}), keep_alive=False)
+                    await writer.drain()
+                    break
+                if requete is None:
+                    break
+                methode, cible, entetes, corps = requete
+                try:
+                    reponse = await self.dispatch(methode, cible, entetes, corps)
+                except HTTPError as e:
+                    reponse = _json(e.status, {"erreur": str(e)})
+                except Exception as e:
+                    reponse = _json(500, {"erreur": f"{type(e).__name__}: {e}"})
+                keep_alive = entetes.get("connection", "").lower() != "close"
+                _write_response(writer, *reponse, keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _json(status, donnees):
+    return status, "application/json; charset=utf-8", json.dumps(donnees, ensure_ascii=False).encode('utf-8')
+
+
+async def _read_request(reader):
+    # (méthode, cible, en-têtes en minuscules, corps) ; None si la connexion est fermée
+    ligne = await reader.readline()
+    if not ligne:
+        return None
+    try:
+        methode, cible, _ = ligne.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "Requête HTTP invalide.")
+    entetes = {}
+    while True:
+        ligne = await reader.readline()
+        if ligne in (b"\r\n", b"\n", b""):
+            break
+        nom, _, valeur = ligne.decode('latin-1').partition(':')
+        entetes[nom.strip().lower()] = valeur.strip()
+    try:
+        taille = int(entetes.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "En-tête Content-Length invalide.")
+    if taille < 0:
+        raise HTTPError(400, "En-tête Content-Length invalide.")
+    if taille > MAX_BODY:
+        raise HTTPError(413, "Requête trop volumineuse.")
+    corps = await reader.readexactly(taille) if taille else b""
+    return methode.upper(), cible, entetes, corps
+
+
+def _write_response(writer, status, content_type, contenu, keep_alive=True):
+    writer.write(
+        f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(contenu)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + contenu
+    )
+
+
+async def serve(host, port, profil, output_dir=None, workers=None):
+    service = InvoiceService(profil, output_dir, workers)
+    server = await asyncio.start_server(service.handle, host, port, backlog=1024)
+    adresse = server.sockets[0].getsockname()
+    print(f"MYfacture : service à l'écoute sur http://{adresse[0]}:{adresse[1]}", file=sys.stderr)
+    arret = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, arret.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows : Ctrl+C interrompt asyncio.run, le bloc finally s'exécute quand même
+            pass
+    try:
+        async with server:
+            await arret.wait()
+    finally:
+        # Les numéros réservés et non utilisés sont rendus à la série
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service HTTP local de génération de factures.")
+    parser.add_argument("--host", default="127.0.0.1", help="adresse d'écoute (défaut : locale uniquement)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profil", default="profil_entreprise.json", help="profil de l'entreprise par défaut (JSON)")
+    parser.add_argument("--output", default=archive.FACTURES_DIR, help="archive des PDF générés")
+    parser.add_argument("--workers", type=int, default=None, help="processus de rendu (défaut : nb de CPU)")
+    args = parser.parse_args(argv)
+
+    profil = assets.load_profile(args.profil)
+    try:
+        asyncio.run(serve(args.host, args.port, profil, args.output, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+# Tests du moteur de totaux (python -m unittest test_totals, depuis MYfacture).
+import random
+import unittest
+
+import totals
+
+
+class PureTotalsTest(unittest.TestCase):
+    # Calcul Python pur, sans NumPy
+    def setUp(self):
+        self.np = totals._np
+        totals._np = None
+
+    def tearDown(self):
+        totals._np = self.np
+
+    def test_sub_cent_price_rounded_on_line_total(self):
+        # 0.0125 € x 10000 = 125.00 €, et non 0.01 € x 10000 = 100.00 €
+        ligne = totals.compute_line(0.0125, 10000, 20)
+        self.assertEqual(ligne.ht, 12500)
+        self.assertEqual(ligne.tva, 2500)
+        self.assertEqual(ligne.ttc, 15000)
+        self.assertEqual(totals.compute_totals([0.0125], [10000], [20]).ht, 12500)
+
+    def test_line_total_rounded_half_away_from_zero(self):
+        self.assertEqual(totals.compute_line(0.005, 1, 0).ht, 1)
+        self.assertEqual(totals.compute_line(0.0149, 1, 0).ht, 1)
+        self.assertEqual(totals.compute_line(-0.005, 1, 0).ht, -1)
+
+    def test_discount_and_vat(self):
+        ligne = totals.compute_line(19.99, 3, 5.5, 10)
+        self.assertEqual(ligne, totals.Ligne(5997, 600, 5397, 297, 5694))
+
+
+class NumpyTotalsTest(unittest.TestCase):
+    # Le calcul vectorisé donne exactement les mêmes centimes que le calcul pur
+    def setUp(self):
+        if totals.load_numpy() is None:
+            self.skipTest("NumPy n'est pas installé")
+
+    def test_sub_cent_price_rounded_on_line_total(self):
+        self.assertEqual(int(totals.compute_lines([0.0125], [10000], [20]).ht[0]), 12500)
+
+    def test_same_cents_as_pure_python(self):
+        rng = random.Random(0)
+        prix = [round(rng.uniform(-50, 500), rng.choice((2, 4))) for _ in range(2000)]
+        quantites = [rng.randint(1, 10000) for _ in prix]
+        tvas = [rng.choice((0, 5.5, 10, 20)) for _ in prix]
+        remises = [rng.choice((0, 0, 5, 12.5)) for _ in prix]
+        vectorise = totals.compute_lines(prix, quantites, tvas, remises)
+        for i, valeurs in enumerate(zip(prix, quantites, tvas, remises)):
+            self.assertEqual(totals.compute_line(*valeurs), tuple(int(colonne[i]) for colonne in vectorise))
+
+
+if __name__ == "__main__":
+    unittest.main()
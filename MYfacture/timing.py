@@ -0,0 +1,153 @@
+# Mesures de durée par phase, désactivées par défaut.
+#
+# Activation : variable d'environnement MYFACTURE_TIMING=1 (journal dans
+# timings.jsonl à côté de ce fichier) ou MYFACTURE_TIMING=/chemin/journal.jsonl,
+# ou appel à timing.enable(). MYFACTURE_TIMING=0 (false, no, off) les laisse
+# désactivées. Chaque phase écrit une ligne JSON :
+#   {"ts": ..., "span": "render.output", "ms": 12.3, "pid": 1234, ...}
+# Les processus de génération héritent de la variable d'environnement.
+#
+#   python timing.py summary [journal.jsonl] [--top 20]
+import argparse
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ENV_VAR = "MYFACTURE_TIMING"
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'timings.jsonl')
+
+_log_path = None
+_log_file = None
+
+
+class _NoSpan:
+    # Contexte vide partagé : coût quasi nul quand les mesures sont désactivées
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def enable(path=None):
+    global _log_path
+    disable()
+    _log_path = path or DEFAULT_LOG
+    os.environ[ENV_VAR] = _log_path
+
+
+def disable():
+    global _log_path, _log_file
+    if _log_file is not None:
+        _log_file.close()
+    _log_path = None
+    _log_file = None
+
+
+def enabled():
+    return _log_path is not None
+
+
+def _write(record):
+    global _log_file
+    if _log_file is None:
+        _log_file = open(_log_path, 'a', encoding='utf-8', buffering=1)
+    _log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def _span(name, fields):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = {"ts": time.time(), "span": name, "ms": round((time.perf_counter() - debut) * 1000, 3),
+                  "pid": os.getpid()}
+        record.update(fields)
+        _write(record)
+
+
+def span(name, **fields):
+    """Contexte mesurant la durée de la phase `name` (no-op si désactivé)."""
+    if _log_path is None:
+        return _NO_SPAN
+    return _span(name, fields)
+
+
+def summary(path=None, top=20):
+    """(statistiques par phase, opérations les plus lentes) d'un journal."""
+    durees = {}
+    lentes = []
+    # Départage des durées égales : les enregistrements eux-mêmes ne sont pas comparables
+    ordre = itertools.count()
+    with open(path or DEFAULT_LOG, 'r', encoding='utf-8') as f:
+        for ligne in f:
+            try:
+                record = json.loads(ligne)
+            except ValueError:
+                continue
+            durees.setdefault(record["span"], []).append(record["ms"])
+            # Seules les `top` plus lentes sont gardées en mémoire
+            item = (record["ms"], next(ordre), record)
+            if len(lentes) < top:
+                heapq.heappush(lentes, item)
+            elif lentes and item[0] > lentes[0][0]:
+                heapq.heapreplace(lentes, item)
+    stats = []
+    for name, valeurs in durees.items():
+        valeurs.sort()
+        stats.append({
+            "span": name,
+            "count": len(valeurs),
+            "total_ms": round(sum(valeurs), 3),
+            "mean_ms": round(sum(valeurs) / len(valeurs), 3),
+            "p95_ms": valeurs[min(len(valeurs) - 1, int(len(valeurs) * 0.95))],
+            "max_ms": valeurs[-1],
+        })
+    stats.sort(key=lambda s: s["total_ms"], reverse=True)
+    return stats, [record for _, _, record in sorted(lentes, key=lambda item: item[0], reverse=True)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Résumé d'un journal de mesures MYfacture.")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("log", nargs="?", default=DEFAULT_LOG)
+    parser.add_argument("--top", type=int, default=20, help="nombre d'opérations les plus lentes à afficher")
+    args = parser.parse_args(argv)
+
+    stats, lentes = summary(args.log, args.top)
+    print(f"{'phase':<32} {'nb':>7} {'total ms':>12} {'moy. ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for s in stats:
+        print(f"{s['span']:<32} {s['count']:>7} {s['total_ms']:>12.1f} {s['mean_ms']:>10.2f} "
+              f"{s['p95_ms']:>10.2f} {s['max_ms']:>10.2f}")
+    print("\nOpérations les plus lentes :")
+    for record in lentes:
+        details = {k: v for k, v in record.items() if k not in ("ts", "span", "ms", "pid")}
+        print(f"  {record['ms']:>10.2f} ms  {record['span']}  {json.dumps(details, ensure_ascii=False) if details else ''}")
+    return 0
+
+
+def _env_log_path(valeur):
+    # "", "0", "false", "no", "off" : désactivé ; "1", "true", "yes", "on" :
+    # journal par défaut ; toute autre valeur est le chemin du journal
+    mot = valeur.strip().lower()
+    if mot in ("", "0", "false", "no", "off", "non"):
+        return None
+    if mot in ("1", "true", "yes", "on", "oui"):
+        return DEFAULT_LOG
+    return valeur
+
+
+# Activation par l'environnement, y compris dans les processus de travail
+_log_path = _env_log_path(os.environ.get(ENV_VAR, ""))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# Moteur de calcul des totaux de facture, indépendant de l'interface Tk.
+#
+# Tous les montants sont calculés en centimes entiers (taux en centièmes de
+# pourcent) pour un arrondi exact au centime : l'écran, le PDF et les
+# traitements par lot utilisent les mêmes formules et ne peuvent pas diverger.
+# Les prix unitaires sont lus en millionièmes d'euro : un prix inférieur au
+# centime (0.0125 € l'unité) n'est arrondi qu'au total de la ligne.
+# NumPy est utilisé s'il est installé, sinon un calcul Python pur équivalent ;
+# il n'est importé qu'au premier calcul sur des colonnes (démarrage plus rapide).
+from collections import namedtuple
+
+_np = False  # pas encore chargé
+
+# Montants d'une ligne ou d'une facture, en centimes.
+# ht : prix x quantité avant remise, net : ht - remise, ttc : net + tva.
+Ligne = namedtuple("Ligne", ["ht", "remise", "net", "tva", "ttc"])
+Totaux = namedtuple("Totaux", ["ht", "remise", "tva", "ttc"])
+
+
+def to_cents(montant):
+    return int(round(float(montant) * 100))
+
+
+def to_micros(prix):
+    # 0.0125 -> 12500 millionièmes
+    return int(round(float(prix) * 1000000))
+
+
+def to_basis_points(taux):
+    # 20 % -> 2000, 5.5 % -> 550
+    return int(round(float(taux) * 100))
+
+
+def format_cents(centimes):
+    signe = "-" if centimes < 0 else ""
+    centimes = abs(int(centimes))
+    return f"{signe}{centimes // 100}.{centimes % 100:02d}"
+
+
+def _div_round(a, b):
+    # Division entière arrondie au plus proche, demi vers l'extérieur (b > 0)
+    if a < 0:
+        return -((-a * 2 + b) // (2 * b))
+    return (a * 2 + b) // (2 * b)
+
+
+def load_numpy():
+    # Module numpy, ou None s'il n'est pas installé ; importé au premier appel
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _np = numpy
+    return _np
+
+
+def _np_div_round(a, b):
+    np = _np
+    return np.sign(a) * ((np.abs(a) * 2 + b) // (2 * b))
+
+
+def compute_line(prix, quantite, tva, remise=0):
+    ht = _div_round(to_micros(prix) * int(quantite), 10000)
+    montant_remise = _div_round(ht * to_basis_points(remise), 10000)
+    net = ht - montant_remise
+    montant_tva = _div_round(net * to_basis_points(tva), 10000)
+    return Ligne(ht, montant_remise, net, montant_tva, net + montant_tva)
+
+
+def _np_columns(prix, quantite, tva, remise):
+    np = load_numpy()
+    prix_u = np.rint(np.asarray(prix, dtype=np.float64) * 1000000).astype(np.int64)
+    qte = np.asarray(quantite, dtype=np.int64)
+    tva_bp = np.rint(np.asarray(tva, dtype=np.float64) * 100).astype(np.int64)
+    remise_bp = np.rint(np.asarray(remise, dtype=np.float64) * 100).astype(np.int64)
+    ht = _np_div_round(prix_u * qte, 10000)
+    montant_remise = _np_div_round(ht * remise_bp, 10000)
+    net = ht - montant_remise
+    montant_tva = _np_div_round(net * tva_bp, 10000)
+    return Ligne(ht, montant_remise, net, montant_tva, net + montant_tva)
+
+
+def compute_lines(prix, quantite, tva, remise=None):
+    """Calcule les montants de chaque ligne.
+
+    Les colonnes peuvent être des listes ou des tableaux NumPy de même
+    longueur. Retourne une Ligne dont chaque champ est une colonne de
+    centimes (tableau NumPy si disponible, liste sinon).
+    """
+    if remise is None:
+        remise = [0] * len(prix)
+    if load_numpy() is not None:
+        return _np_columns(prix, quantite, tva, remise)
+    lignes = [compute_line(*valeurs) for valeurs in zip(prix, quantite, tva, remise)]
+    if not lignes:
+        return Ligne([], [], [], [], [])
+    return Ligne(*(list(colonne) for colonne in zip(*lignes)))
+
+
+def compute_totals(prix, quantite, tva, remise=None):
+    """Totaux d'une facture, en centimes, à partir de ses colonnes de lignes."""
+    lignes = compute_lines(prix, quantite, tva, remise)
+    ht = int(sum(lignes.ht))
+    montant_remise = int(sum(lignes.remise))
+    montant_tva = int(sum(lignes.tva))
+    return Totaux(ht, montant_remise, montant_tva, ht - montant_remise + montant_tva)
+
+
+def compute_batch(facture, prix, quantite, tva, remise=None, nb_factures=None):
+    """Totaux de nombreuses factures en un seul passage vectorisé.
+
+    `facture` donne, pour chaque ligne, l'indice (0, 1, 2...) de la facture
+    à laquelle elle appartient ; les lignes n'ont pas besoin d'être triées.
+    Retourne un Totaux dont chaque champ est une colonne indexée par facture.
+    """
+    if remise is None:
+        remise = [0] * len(prix)
+    np = load_numpy()
+    if np is None:
+        if nb_factures is None:
+            nb_factures = max(facture) + 1 if len(facture) else 0
+        sommes = [[0] * nb_factures for _ in range(3)]
+        for f, valeurs in zip(facture, zip(prix, quantite, tva, remise)):
+            ligne = compute_line(*valeurs)
+            sommes[0][f] += ligne.ht
+            sommes[1][f] += ligne.remise
+            sommes[2][f] += ligne.tva
+        ht, montant_remise, montant_tva = sommes
+        ttc = [h - r + t for h, r, t in zip(ht, montant_remise, montant_tva)]
+        return Totaux(ht, montant_remise, montant_tva, ttc)
+
+    facture = np.asarray(facture, dtype=np.int64)
+    if nb_factures is None:
+        nb_factures = int(facture.max()) + 1 if facture.size else 0
+    lignes = _np_columns(prix, quantite, tva, remise)
+    ht = np.zeros(nb_factures, dtype=np.int64)
+    montant_remise = np.zeros(nb_factures, dtype=np.int64)
+    montant_tva = np.zeros(nb_factures, dtype=np.int64)
+    if facture.size:
+        # Tri stable puis réduction par segment : sommes entières exactes
+        ordre = np.argsort(facture, kind="stable")
+        codes = facture[ordre]
+        debuts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        cibles = codes[debuts]
+        ht[cibles] = np.add.reduceat(lignes.ht[ordre], debuts)
+        montant_remise[cibles] = np.add.reduceat(lignes.remise[ordre], debuts)
+        montant_tva[cibles] = np.add.reduceat(lignes.tva[ordre], debuts)
+    return Totaux(ht, montant_remise, montant_tva, ht - montant_remise + montant_tva)
+
+
+class RunningTotals:
+    """Totaux cumulés d'une facture en cours, mis à jour ligne par ligne.
+
+    Ajouter ou retirer une ligne ne coûte qu'une addition ; `reset` permet de
+    repartir d'un recalcul complet.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, totaux=None):
+        totaux = totaux or Totaux(0, 0, 0, 0)
+        self.ht = totaux.ht
+        self.remise = totaux.remise
+        self.tva = totaux.tva
+
+    def add(self, ligne):
+        self.ht += ligne.ht
+        self.remise += ligne.remise
+        self.tva += ligne.tva
+
+    def remove(self, ligne):
+        self.ht -= ligne.ht
+        self.remise -= ligne.remise
+        self.tva -= ligne.tva
+
+    def totals(self):
+        return Totaux(self.ht, self.remise, self.tva, self.ht - self.remise + self.tva)